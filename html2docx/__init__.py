@@ -1,15 +1,238 @@
+import codecs
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
 from io import BytesIO
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Union
 
+import docx
+
+from .cache import ResultCache
 from .html2docx import HTML2Docx
+from .image import shares_image_cache
+from .package import Destination, save_document
+from .resample import ImageResampler
+from .template import DocumentTemplate
+
+CHUNK_SIZE = 64 * 1024
+PACKAGE_DIR = pathlib.Path(__file__).parent
+# Documents written to non-seekable streams are spooled in memory up to this
+# size, then to a temporary file.
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Options of HTML2Docx that do not change the documents kept in a ResultCache.
+# Documents with broken images are not cached, image fetching limits only decide
+# whether images break.
+RESULT_NEUTRAL_OPTIONS = {
+    "direct_xml",
+    "image_deadline",
+    "instrumentation",
+    "max_image_bytes",
+    "max_workers",
+}
 
+Source = Union[IO[str], IO[bytes], Iterable[str], Iterable[bytes]]
 
-def html2docx(content: str, title: str) -> BytesIO:
+
+def html2docx(
+    content: str, title: str, result_cache: Optional[ResultCache] = None, **kwargs: Any
+) -> BytesIO:
     """Convert valid HTML content to a docx document and return it as a
     io.BytesIO() object.
+
+    With a result_cache, documents are looked up by a hash of the content, title,
+    options and library version before being converted, and stored once converted,
+    unless they contain broken images. Custom fetchers and image loaders bypass the
+    cache.
+
+    Extra keyword arguments are passed to HTML2Docx.
     """
-    parser = HTML2Docx(title)
-    parser.feed(content.strip())
+    key = None
+    if result_cache is not None:
+        key = result_key(content, title, kwargs)
+        data = None if key is None else result_cache.get(key)
+        if data is not None:
+            instrumentation = kwargs.get("instrumentation")
+            if instrumentation is not None:
+                instrumentation.count("result_cache_hits")
+            return BytesIO(data)
+    parser = convert(content, title, **kwargs)
+    buf = BytesIO()
+    save(parser, buf)
+    if result_cache is not None and key is not None and not parser.broken_images:
+        result_cache.set(key, buf.getvalue())
+    return buf
+
+
+def html2docx_stream(
+    source: Source, title: str, encoding: str = "utf-8-sig", **kwargs: Any
+) -> BytesIO:
+    """Convert valid HTML read from source to a docx document and return it as a
+    io.BytesIO() object.
 
+    source is a text or binary file object, or an iterable of str or bytes chunks.
+    Bytes are decoded incrementally with encoding. The HTML is fed to the parser as
+    it is read, the whole content is never held in memory.
+
+    Extra keyword arguments are passed to HTML2Docx.
+    """
+    parser = convert(source, title, encoding, **kwargs)
     buf = BytesIO()
-    parser.doc.save(buf)
+    save(parser, buf)
     return buf
+
+
+def html2docx_save(
+    content: Union[str, Source],
+    title: str,
+    destination: Destination,
+    encoding: str = "utf-8-sig",
+    **kwargs: Any,
+) -> None:
+    """Convert valid HTML to a docx document and save it to destination.
+
+    content is a str, as for html2docx(), or a source, as for html2docx_stream().
+    destination is a file path or a writable binary stream. The document is written
+    directly to paths and seekable streams. For non-seekable streams, e.g. sockets
+    or pipes, it is spooled to a temporary file that spills to disk above
+    SPOOL_MAX_SIZE, then copied.
+
+    Extra keyword arguments are passed to HTML2Docx.
+    """
+    parser = convert(content, title, encoding, **kwargs)
+    if isinstance(destination, (str, os.PathLike)) or is_seekable(destination):
+        save(parser, destination)
+        return
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+        save(parser, spool)
+        spool.seek(0)
+        shutil.copyfileobj(spool, destination, CHUNK_SIZE)
+
+
+def convert(
+    content: Union[str, Source], title: str, encoding: str = "utf-8-sig", **kwargs: Any
+) -> HTML2Docx:
+    """Feed content to a new HTML2Docx parser and return the closed parser."""
+    parser = HTML2Docx(title, **kwargs)
+    if isinstance(content, str):
+        parser.feed(content.strip())
+    else:
+        feed_chunks(parser, decode_chunks(content, encoding))
+    parser.close()
+    return parser
+
+
+def save(parser: HTML2Docx, file: Destination) -> None:
+    """Save the document built by parser to file."""
+    if parser.instrumentation is None:
+        save_document(parser.doc, file)
+        return
+    with parser.instrumentation.phase("save"):
+        save_document(parser.doc, file)
+
+
+@functools.lru_cache(maxsize=None)
+def library_version() -> str:
+    """Return the versions of html2docx and python-docx, which shape documents.
+
+    html2docx is identified by a hash of its package files rather than its release,
+    so that result keys change with the code, also in checkouts run from source.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(PACKAGE_DIR.iterdir()):
+        if path.is_file():
+            digest.update(path.name.encode())
+            digest.update(b"\0")
+            digest.update(path.read_bytes())
+    return f"html2docx {digest.hexdigest()}, python-docx {docx.__version__}"
+
+
+def option_value(value: Any) -> Any:
+    """Return how value identifies the output in result_key()."""
+    if isinstance(value, DocumentTemplate):
+        return value.digest
+    if isinstance(value, ImageResampler):
+        return value.options
+    raise TypeError(f"{type(value).__name__} does not identify the output")
+
+
+def result_key(content: str, title: str, options: Dict[str, Any]) -> Optional[str]:
+    """Return the key of a conversion in a ResultCache, None when its options do
+    not identify the document.
+    """
+    options = {
+        name: value
+        for name, value in options.items()
+        if name not in RESULT_NEUTRAL_OPTIONS
+    }
+    # Fetchers that share the image cache retrieve the same images as the default
+    # one. Other fetchers, subclasses of HTTPImageFetcher included, do not identify
+    # the images and bypass the cache.
+    if "fetcher" in options and shares_image_cache(options["fetcher"]):
+        del options["fetcher"]
+    try:
+        header = json.dumps(
+            [library_version(), title, options], sort_keys=True, default=option_value
+        )
+    except TypeError:
+        return None
+    digest = hashlib.sha256(header.encode())
+    digest.update(b"\0")
+    digest.update(content.encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+def is_seekable(stream: IO[bytes]) -> bool:
+    try:
+        return stream.seekable()
+    except (AttributeError, ValueError):
+        # AttributeError: File-like object without seekable().
+        # ValueError: Closed file.
+        return False
+
+
+def read_chunks(source: Source) -> Iterator[Union[str, bytes]]:
+    if hasattr(source, "read"):
+        fp: IO[Any] = source  # type: ignore[assignment]
+        while True:
+            chunk = fp.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from source
+
+
+def decode_chunks(source: Source, encoding: str) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in read_chunks(source):
+        yield decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+    yield decoder.decode(b"", final=True)
+
+
+def feed_chunks(parser: HTML2Docx, chunks: Iterable[str]) -> None:
+    """Feed the chunks to parser, as html2docx() feeds the stripped content.
+
+    The content is fed up to and including the last "<" seen, so that the parser
+    sees each text node whole, as it does when fed the complete content. The rest
+    is kept for the next chunk, which also holds back trailing whitespace.
+    """
+    # Only the new chunk is searched for "<", pending text is joined once fed.
+    pending: List[str] = []
+    started = False
+    for chunk in chunks:
+        if not started:
+            chunk = chunk.lstrip()
+            started = bool(chunk)
+        end = chunk.rfind("<") + 1
+        if end:
+            pending.append(chunk[:end])
+            parser.feed("".join(pending))
+            pending = [chunk[end:]]
+        else:
+            pending.append(chunk)
+    parser.feed("".join(pending).rstrip())
@@ -0,0 +1,371 @@
+import asyncio
+import concurrent.futures
+import http
+import http.client
+import io
+import os
+import ssl
+import urllib.error
+import urllib.parse
+from typing import Any, Optional, Tuple
+
+from . import convert, save
+from .cache import FailureCache
+from .image import (
+    DEFAULT_FAILURE_TTL,
+    DEFAULT_TIMEOUT,
+    MAX_IMAGE_SIZE,
+    MAX_REDIRECTS,
+    READ_CHUNK_SIZE,
+    REDIRECT_STATUSES,
+    REQUEST_HEADERS,
+    BudgetExceeded,
+    FetchBudget,
+    ImageBuffer,
+    ImageData,
+    ImageLoader,
+    current_budget,
+    fetcher_cache,
+    get_proxy,
+    is_failure,
+    proxy_headers,
+)
+from .instrumentation import Instrumentation, current_instrumentation
+
+
+class AsyncImageFetcher:
+    """Retrieve the data of external images from an asyncio event loop.
+
+    Subclass and override fetch() to serve images from another source. Images are
+    cached per fetcher unless it sets shared_cache, like for ImageFetcher.
+    """
+
+    shared_cache = False
+
+    async def fetch(self, src: str) -> Optional[bytes]:
+        """Return the data found at src, or None when it cannot be retrieved."""
+        raise NotImplementedError
+
+
+class AsyncHTTPImageFetcher(AsyncImageFetcher):
+    """Fetch images over HTTP(S) with asyncio streams.
+
+    Each image is fetched on its own connection. Transient network errors are
+    retried like HTTPImageFetcher does, without blocking the event loop. timeout
+    limits each request attempt, in seconds. URLs that could not be retrieved are
+    not requested again for failure_ttl seconds. Proxies are configured like for
+    HTTPImageFetcher.
+    """
+
+    shared_cache = True
+
+    def __init__(
+        self,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,
+        failure_ttl: float = DEFAULT_FAILURE_TTL,
+    ) -> None:
+        self.timeout = timeout
+        self.ssl_context: Optional[ssl.SSLContext] = None
+        self.failures = FailureCache(failure_ttl)
+
+    async def fetch(self, src: str) -> Optional[bytes]:
+        if is_failure(src, self.failures):
+            return None
+        try:
+            image_bytes = await self.retry(src)
+        except BudgetExceeded:
+            # Another document may have the budget for it.
+            return None
+        if image_bytes is None:
+            self.failures.add(src)
+        return image_bytes
+
+    async def retry(self, src: str) -> Optional[bytes]:
+        """Get src, retrying transient network errors."""
+        retry = 3
+        while retry:
+            try:
+                return await asyncio.wait_for(self.get(src), self.timeout)
+            except (ValueError, http.client.HTTPException, urllib.error.HTTPError):
+                # ValueError: Invalid URL or non-integer Content-Length.
+                # HTTPException: Server does not speak HTTP properly.
+                # HTTPError: Server could not perform request.
+                break
+            except urllib.error.URLError:
+                # URLError: Transient network error, e.g. DNS request failed.
+                retry -= 1
+                if retry:
+                    instrumentation = current_instrumentation.get()
+                    if instrumentation is not None:
+                        instrumentation.count("image_retries")
+                    await asyncio.sleep(1)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                # Connection lost or timed out while reading the response.
+                break
+        return None
+
+    async def get(self, url: str, redirects: int = MAX_REDIRECTS) -> Optional[bytes]:
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"unsupported url: {url!r}")
+        proxy = get_proxy(parts.scheme, parts.hostname)
+        reader, writer = await self.connect(parts, proxy)
+        try:
+            # The host and port of the URL, without its credentials.
+            host = parts.netloc.rpartition("@")[2]
+            path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+            headers = REQUEST_HEADERS
+            if proxy is not None and parts.scheme == "http":
+                # The proxy forwards requests for the absolute URL.
+                path = f"http://{host}{path}"
+                headers = {**headers, **proxy_headers(proxy)}
+            request = [f"GET {path} HTTP/1.1", f"Host: {host}"]
+            request += [f"{name}: {value}" for name, value in headers.items()]
+            request += ["Connection: close", "", ""]
+            writer.write("\r\n".join(request).encode("latin-1"))
+            status, response_headers = await read_head(reader)
+
+            location = response_headers.get("Location")
+            if status in REDIRECT_STATUSES and location and redirects:
+                return await self.get(
+                    urllib.parse.urljoin(url, location), redirects - 1
+                )
+            if not 200 <= status < 300:
+                raise urllib.error.HTTPError(url, status, "", response_headers, None)
+            size = response_headers.get("Content-Length")
+            if size and int(size) > MAX_IMAGE_SIZE:
+                return None
+            if "chunked" in response_headers.get("Transfer-Encoding", "").lower():
+                return await read_chunked(reader)
+            return await read_image(reader, int(size) if size else None)
+        finally:
+            writer.close()
+
+    async def connect(
+        self, parts: urllib.parse.SplitResult, proxy: Optional[str]
+    ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Open a connection to the host of parts, through proxy unless None. HTTPS
+        connections through a proxy go through a CONNECT tunnel.
+        """
+        context = None
+        if parts.scheme == "https":
+            if self.ssl_context is None:
+                self.ssl_context = ssl.create_default_context()
+            context = self.ssl_context
+        hostname = parts.hostname or ""
+        port = parts.port or (443 if context else 80)
+        try:
+            if proxy is None:
+                return await asyncio.open_connection(hostname, port, ssl=context)
+            proxy_parts = urllib.parse.urlsplit(proxy)
+            reader, writer = await asyncio.open_connection(
+                proxy_parts.hostname, proxy_parts.port or 80
+            )
+        except OSError as e:
+            raise urllib.error.URLError(e)
+        if context is None:
+            return reader, writer
+        try:
+            return await tunnel(reader, writer, hostname, port, proxy, context)
+        except BaseException:
+            writer.close()
+            raise
+
+
+# Shared by the conversions that do not pass a fetcher, so that URLs that failed
+# are not requested again by each of them.
+default_async_fetcher = AsyncHTTPImageFetcher()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=default_async_fetcher.failures.after_fork)
+
+
+async def tunnel(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    host: str,
+    port: int,
+    proxy: str,
+    context: ssl.SSLContext,
+) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Open a tunnel to host and port through the proxy connection, and return its
+    streams once upgraded to TLS.
+    """
+    target = f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+    request = [f"CONNECT {target} HTTP/1.1", f"Host: {target}"]
+    request += [f"{name}: {value}" for name, value in proxy_headers(proxy).items()]
+    request += ["", ""]
+    writer.write("\r\n".join(request).encode("latin-1"))
+    status, _ = await read_head(reader)
+    if not 200 <= status < 300:
+        raise OSError(f"Tunnel connection failed: {status}")
+    if hasattr(writer, "start_tls"):
+        # Python 3.11+
+        await writer.start_tls(context, server_hostname=host)
+        return reader, writer
+    loop = asyncio.get_running_loop()
+    protocol = writer.transport.get_protocol()
+    transport = await loop.start_tls(
+        writer.transport, protocol, context, server_hostname=host
+    )
+    if transport is None:
+        raise OSError("TLS upgrade failed")
+    return reader, asyncio.StreamWriter(transport, protocol, reader, loop)
+
+
+async def read_head(
+    reader: asyncio.StreamReader,
+) -> Tuple[int, http.client.HTTPMessage]:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.LimitOverrunError:
+        raise http.client.LineTooLong("header")
+    status_line, _, header_lines = head.partition(b"\r\n")
+    version, _, rest = status_line.decode("latin-1").partition(" ")
+    if not version.startswith("HTTP/"):
+        raise http.client.BadStatusLine(status_line.decode("latin-1"))
+    try:
+        status = int(rest.split(" ", 1)[0])
+    except ValueError:
+        raise http.client.BadStatusLine(status_line.decode("latin-1"))
+    headers = http.client.parse_headers(io.BytesIO(header_lines))
+    return status, headers
+
+
+async def read_image(
+    reader: asyncio.StreamReader, size: Optional[int]
+) -> Optional[bytes]:
+    """Read the image from reader by chunks, size bytes or up to the end of the
+    stream when size is None. See ImageBuffer.
+    """
+    buffer = ImageBuffer()
+    while size is None or buffer.size < size:
+        limit = READ_CHUNK_SIZE if size is None else size - buffer.size
+        chunk = await reader.read(min(limit, READ_CHUNK_SIZE))
+        if not chunk:
+            if size is not None:
+                raise asyncio.IncompleteReadError(b"", size)
+            break
+        if not buffer.add(chunk):
+            return None
+    return buffer.getvalue()
+
+
+async def read_chunked(reader: asyncio.StreamReader) -> Optional[bytes]:
+    buffer = ImageBuffer()
+    while True:
+        line = await reader.readline()
+        try:
+            size = int(line.split(b";", 1)[0], 16)
+        except ValueError:
+            raise http.client.IncompleteRead(b"")
+        if not size:
+            return buffer.getvalue()
+        while size:
+            chunk = await reader.read(min(size, READ_CHUNK_SIZE))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", size)
+            if not buffer.add(chunk):
+                return None
+            size -= len(chunk)
+        await reader.readexactly(2)
+
+
+class AsyncImageLoader(ImageLoader):
+    """Load external images on loop, for a document parsed in another thread.
+
+    Fetches run as tasks of the event loop, result() waits for them from the parser
+    thread.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        fetcher: AsyncImageFetcher,
+        deadline: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        instrumentation: Optional[Instrumentation] = None,
+    ):
+        super().__init__(0, None, deadline, max_bytes, instrumentation)
+        self.loop = loop
+        self.async_fetcher = fetcher
+        self.cache = fetcher_cache(fetcher)
+
+    def submit(self, src: str) -> str:
+        if src in self.futures or src.startswith("data:"):
+            return super().submit(src)
+        self.futures[src] = asyncio.run_coroutine_threadsafe(
+            self.load_async(src), self.loop
+        )
+        return src
+
+    async def load_async(self, src: str) -> ImageData:
+        image_data = self.cached(src)
+        if image_data is not None:
+            return image_data
+        image_bytes = None
+        if not self.over_budget():
+            # Each task runs in its own context.
+            budget = FetchBudget(self)
+            current_budget.set(budget)
+            image_bytes = self.spend(await self.fetch_async(src), budget)
+        return self.validate(src, image_bytes)
+
+    async def fetch_async(self, src: str) -> Optional[bytes]:
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return await self.async_fetcher.fetch(src)
+        # Each task runs in its own context.
+        current_instrumentation.set(instrumentation)
+        with instrumentation.phase("image_fetch"):
+            image_bytes = await self.async_fetcher.fetch(src)
+        self.count_fetched(image_bytes)
+        return image_bytes
+
+    def cancel(self) -> None:
+        for future in list(self.futures.values()):
+            future.cancel()
+
+
+async def html2docx_async(
+    content: str,
+    title: str,
+    fetcher: Optional[AsyncImageFetcher] = None,
+    timeout: Optional[float] = None,
+    executor: Optional[concurrent.futures.Executor] = None,
+    image_deadline: Optional[float] = None,
+    max_image_bytes: Optional[int] = None,
+    **kwargs: Any,
+) -> io.BytesIO:
+    """Convert valid HTML content to a docx document and return it as a
+    io.BytesIO() object, without blocking the event loop.
+
+    External images are fetched concurrently on the event loop by fetcher, a shared
+    AsyncHTTPImageFetcher by default. Parsing and saving the document run in
+    executor, the loop default executor when omitted. The conversion is abandoned
+    with asyncio.TimeoutError after timeout seconds, or when the task is cancelled.
+    image_deadline and max_image_bytes limit image fetching as for HTML2Docx.
+
+    Extra keyword arguments are passed to HTML2Docx.
+    """
+    loop = asyncio.get_running_loop()
+    loader = AsyncImageLoader(
+        loop,
+        fetcher or default_async_fetcher,
+        image_deadline,
+        max_image_bytes,
+        kwargs.get("instrumentation"),
+    )
+
+    def build() -> io.BytesIO:
+        parser = convert(content, title, image_loader=loader, **kwargs)
+        buf = io.BytesIO()
+        save(parser, buf)
+        return buf
+
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(executor, build), timeout)
+    except BaseException:
+        # Release the parser thread, which may be waiting for images.
+        loader.cancel()
+        raise
@@ -0,0 +1,182 @@
+import concurrent.futures
+import os
+import pathlib
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from . import html2docx, html2docx_stream
+from .template import DocumentTemplate, default_template
+
+# A job is a (html, title) pair, or the path of an HTML file titled by its stem.
+Job = Union[Tuple[str, str], str, "os.PathLike[str]"]
+TemplatePath = Union[str, "os.PathLike[str]"]
+
+
+class BatchResult(NamedTuple):
+    """The outcome of a job: the docx data, or the exception raised converting it."""
+
+    position: int
+    title: str
+    docx: Optional[bytes]
+    error: Optional[BaseException]
+
+
+# The template of the worker process, loaded once by init_worker().
+worker_template: Optional[DocumentTemplate] = None
+
+
+def init_worker(template: Optional[TemplatePath]) -> None:
+    global worker_template
+    worker_template = DocumentTemplate(template) if template else default_template()
+
+
+def job_title(job: Job) -> str:
+    if isinstance(job, tuple):
+        return job[1]
+    return pathlib.Path(job).stem
+
+
+def convert_job(job: Job, kwargs: Dict[str, Any]) -> bytes:
+    if isinstance(job, tuple):
+        html, title = job
+        return html2docx(html, title, **kwargs).getvalue()
+    with open(job, "rb") as fp:
+        return html2docx_stream(fp, job_title(job), **kwargs).getvalue()
+
+
+def convert_worker_job(job: Job, kwargs: Dict[str, Any]) -> bytes:
+    return convert_job(job, dict(kwargs, template=worker_template))
+
+
+class PendingJob(NamedTuple):
+    position: int
+    job: Job
+    future: "concurrent.futures.Future[bytes]"
+    executor: concurrent.futures.ProcessPoolExecutor
+    # The number of pools that broke while the job was pending in them.
+    broken_pools: int
+
+
+# A job pending in this many broken pools runs alone, to find out whether it is the
+# one killing the workers.
+ISOLATE_AFTER = 2
+
+
+def convert_many(
+    jobs: Iterable[Job],
+    max_workers: Optional[int] = None,
+    ordered: bool = True,
+    template: Optional[TemplatePath] = None,
+    **kwargs: Any,
+) -> Iterator[BatchResult]:
+    """Convert jobs in a pool of max_workers processes and yield their results.
+
+    Results are yielded in the order of jobs, or as they complete when ordered is
+    false. A job that fails yields a result with its error and does not stop the
+    batch. When a worker dies, the pool is replaced and the jobs pending in it are
+    submitted again. A job pending in two pools that broke is retried alone, and
+    fails with BrokenProcessPool when it breaks that pool too. Workers load
+    template, a docx path, or the default template once when they start. At most
+    twice max_workers jobs are pending at a time, so that jobs and results are
+    streamed.
+
+    Extra keyword arguments are passed to HTML2Docx and must be picklable.
+    max_workers set to 0 converts the jobs in the calling process.
+    """
+    if max_workers == 0:
+        if template:
+            kwargs["template"] = DocumentTemplate(template)
+        for index, job in enumerate(jobs):
+            try:
+                result = convert_job(job, kwargs)
+            except Exception as e:
+                yield BatchResult(index, job_title(job), None, e)
+            else:
+                yield BatchResult(index, job_title(job), result, None)
+        return
+
+    workers = max_workers or os.cpu_count() or 1
+    jobs_iter = enumerate(jobs)
+    pending: Deque[PendingJob] = deque()
+
+    def new_executor(workers: int = workers) -> concurrent.futures.ProcessPoolExecutor:
+        return concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=init_worker, initargs=(template,)
+        )
+
+    executor = new_executor()
+
+    def replace_executor(broken: concurrent.futures.ProcessPoolExecutor) -> None:
+        nonlocal executor
+        if broken is executor:
+            executor.shutdown(wait=False)
+            executor = new_executor()
+
+    def start(position: int, job: Job, broken_pools: int = 0) -> PendingJob:
+        if broken_pools >= ISOLATE_AFTER:
+            alone = new_executor(1)
+            future = alone.submit(convert_worker_job, job, kwargs)
+            return PendingJob(position, job, future, alone, broken_pools)
+        try:
+            future = executor.submit(convert_worker_job, job, kwargs)
+        except BrokenProcessPool:
+            replace_executor(executor)
+            future = executor.submit(convert_worker_job, job, kwargs)
+        return PendingJob(position, job, future, executor, broken_pools)
+
+    def submit() -> None:
+        for index, job in jobs_iter:
+            pending.append(start(index, job))
+            if len(pending) >= 2 * workers:
+                return
+
+    try:
+        submit()
+        while pending:
+            if ordered:
+                entry = pending.popleft()
+            else:
+                done, _ = concurrent.futures.wait(
+                    [entry.future for entry in pending],
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                entry = next(entry for entry in pending if entry.future in done)
+                pending.remove(entry)
+            title = job_title(entry.job)
+            try:
+                result = entry.future.result()
+            except BrokenProcessPool as e:
+                replace_executor(entry.executor)
+                if entry.broken_pools < ISOLATE_AFTER:
+                    # The worker of another job may have died, try again.
+                    retry = start(entry.position, entry.job, entry.broken_pools + 1)
+                    if ordered:
+                        pending.appendleft(retry)
+                    else:
+                        pending.append(retry)
+                    continue
+                yield BatchResult(entry.position, title, None, e)
+            except Exception as e:
+                yield BatchResult(entry.position, title, None, e)
+            else:
+                yield BatchResult(entry.position, title, result, None)
+            finally:
+                if entry.executor is not executor:
+                    entry.executor.shutdown(wait=False)
+            submit()
+    finally:
+        for entry in pending:
+            if entry.executor is not executor:
+                entry.executor.shutdown(wait=False)
+        executor.shutdown()
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Generic, Iterator, NamedTuple, Optional, Tuple, TypeVar, Union
+
+V = TypeVar("V")
+
+DISK_CACHE_SUFFIX = ".cache"
+
+RESULT_CACHE_SIZE = 64 * 1024 * 1024  # 64 MiB
+FAILURE_CACHE_SIZE = 10000
+DISK_RESULT_CACHE_SIZE = 1024 * 1024 * 1024  # 1 GiB
+
+
+class LRUCache(Generic[V]):
+    """A thread-safe least recently used cache, bounded by the size of its values.
+
+    Values larger than max_size are not stored. The hits, misses and evictions
+    counters are cumulative, see stats().
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, Tuple[V, int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def after_fork(self) -> None:
+        # Another thread may have held the lock when the process forked.
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[V]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: V, size: int) -> None:
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            if size > self.max_size:
+                return
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "size": self.size,
+            }
+
+
+class FailureCache:
+    """A thread-safe set of keys, e.g. URLs that could not be retrieved, which
+    expire ttl seconds after they are added.
+
+    It holds up to max_size keys, the oldest are dropped first. A ttl of 0 disables
+    it.
+    """
+
+    def __init__(self, ttl: float, max_size: int = FAILURE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # Expiry times by key, in the order they expire.
+        self.entries: "OrderedDict[str, float]" = OrderedDict()
+
+    def __contains__(self, key: str) -> bool:
+        with self.lock:
+            expiry = self.entries.get(key)
+            if expiry is None:
+                return False
+            if expiry > time.monotonic():
+                return True
+            del self.entries[key]
+            return False
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, key: str) -> None:
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = now + self.ttl
+            while self.entries:
+                oldest, expiry = next(iter(self.entries.items()))
+                if expiry > now and len(self.entries) <= self.max_size:
+                    break
+                del self.entries[oldest]
+
+    def after_fork(self) -> None:
+        # Another thread may have held the lock when the process forked.
+        self.lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+class DiskCacheEntry(NamedTuple):
+    data: bytes
+    metadata: Dict[str, str]
+
+
+class DiskCache:
+    """A cache of byte strings stored as files under directory, bounded by max_size.
+
+    Each entry is a file named after the SHA-256 of its key, holding a line of JSON
+    metadata followed by the data. Files are written atomically, so the directory
+    can be shared by several processes. Once the total size exceeds max_size, the
+    least recently used files are removed.
+    """
+
+    def __init__(self, directory: Union[str, "os.PathLike[str]"], max_size: int):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.size = sum(path.stat().st_size for path in self.paths())
+
+    def paths(self) -> Iterator[pathlib.Path]:
+        return self.directory.glob(f"*{DISK_CACHE_SUFFIX}")
+
+    def path(self, key: str) -> pathlib.Path:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.directory / f"{digest}{DISK_CACHE_SUFFIX}"
+
+    def get(self, key: str) -> Optional[DiskCacheEntry]:
+        path = self.path(key)
+        try:
+            with path.open("rb") as fp:
+                metadata = json.loads(fp.readline())
+                data = fp.read()
+            # The modification time orders the entries for eviction.
+            os.utime(path)
+        except (OSError, ValueError):
+            # OSError: Missing or concurrently evicted entry.
+            # ValueError: Corrupted entry.
+            return None
+        if metadata.get("key") != key:
+            return None
+        return DiskCacheEntry(data, metadata["metadata"])
+
+    def set(
+        self, key: str, data: bytes, metadata: Optional[Dict[str, str]] = None
+    ) -> None:
+        header = json.dumps({"key": key, "metadata": metadata or {}}).encode() + b"\n"
+        size = len(header) + len(data)
+        if size > self.max_size:
+            return
+        path = self.path(key)
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(header)
+                fp.write(data)
+            try:
+                previous_size = path.stat().st_size
+            except FileNotFoundError:
+                previous_size = 0
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        with self.lock:
+            self.size += size - previous_size
+            if self.size > self.max_size:
+                self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for path in self.paths():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        # Other processes may write to the directory, start from the actual size.
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+    def clear(self) -> None:
+        with self.lock:
+            for path in self.paths():
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            self.size = 0
+
+
+class ResultCache:
+    """Converted documents by key, see html2docx().
+
+    Documents are kept in memory, up to memory_size bytes. With a directory, they
+    are also stored on disk, up to disk_size bytes, where they outlive the process
+    and are shared with other processes. Documents found on disk are kept in memory
+    for the next lookups.
+    """
+
+    def __init__(
+        self,
+        memory_size: int = RESULT_CACHE_SIZE,
+        directory: Union[str, "os.PathLike[str]", None] = None,
+        disk_size: int = DISK_RESULT_CACHE_SIZE,
+    ):
+        self.memory: LRUCache[bytes] = LRUCache(memory_size)
+        self.disk = None if directory is None else DiskCache(directory, disk_size)
+
+    def get(self, key: str) -> Optional[bytes]:
+        data = self.memory.get(key)
+        if data is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                data = entry.data
+                self.memory.set(key, data, len(data))
+        return data
+
+    def set(self, key: str, data: bytes) -> None:
+        self.memory.set(key, data, len(data))
+        if self.disk is not None:
+            self.disk.set(key, data)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
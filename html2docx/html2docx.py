@@ -1,20 +1,43 @@
+import copy
+import functools
+import itertools
 import re
 from html.parser import HTMLParser
-from typing import Any, Dict, Iterator, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
 
-from docx import Document
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.oxml.shape import CT_Inline
+from docx.oxml.table import CT_Tbl, CT_Tc
+from docx.oxml.text.paragraph import CT_P
+from docx.oxml.text.run import CT_R, CT_Text
+from docx.oxml.xmlchemy import BaseOxmlElement
 from docx.shared import Pt
-from docx.table import Table
+from docx.table import Table, _Cell
 from docx.text.paragraph import Paragraph
 from docx.text.run import Run
+from lxml import etree
 from tinycss2 import parse_declaration_list
 from tinycss2.ast import DimensionToken, IdentToken
 
-from .image import image_size, load_image
+from .image import DEFAULT_MAX_WORKERS, ImageData, ImageFetcher, ImageLoader, image_size
+from .instrumentation import Instrumentation
+from .resample import ImageResampler
+from .template import DocumentTemplate, default_template
 
 WHITESPACE_RE = re.compile(r"\s+")
 
+# python-docx sizes new cells to the width of their column, 0 while it is built.
+EMPTY_TC = CT_Tc.new()
+EMPTY_TC.width = 0
+EMPTY_P = OxmlElement("w:p")
+
+ParagraphKey = Tuple[Optional[str], Optional[int], Optional[Pt]]
+StartTagHandler = Callable[[str, List[Tuple[str, Optional[str]]]], None]
+EndTagHandler = Callable[[str], None]
+
 ALIGNMENTS = {
     "left": WD_ALIGN_PARAGRAPH.LEFT,
     "center": WD_ALIGN_PARAGRAPH.CENTER,
@@ -22,6 +45,13 @@ ALIGNMENTS = {
     "justify": WD_ALIGN_PARAGRAPH.JUSTIFY,
 }
 
+# Font attributes that set the vertical alignment of the text.
+VERT_ALIGN_ATTRS = ("subscript", "superscript")
+# Number of distinct style attributes whose parsing is kept, see parse_style().
+STYLE_CACHE_SIZE = 1024
+# Number of distinct run formattings whose w:rPr is kept, see run_properties().
+RUN_PROPERTIES_CACHE_SIZE = 256
+
 
 def get_attr(attrs: List[Tuple[str, Optional[str]]], attr_name: str) -> str:
     value = next((val for name, val in attrs if name == attr_name), "")
@@ -43,46 +73,284 @@ def style_to_css(style: str) -> Iterator[Dict[str, Any]]:
                 yield {"name": declaration.lower_name, "value": value.lower_value}
 
 
-def html_attrs_to_font_style(
-    attrs: List[Tuple[str, Optional[str]]]
-) -> List[Tuple[str, Any]]:
-    """Return Font style names based on tag style attributes
+class Style(NamedTuple):
+    """The formatting html2docx applies from a style attribute.
 
-    :param attrs:
-        a list of attribute name plus attribute value tuples.
-    :returns:
-        a list of style names to be applied to Run Font property
+    font holds the Font attributes for runs, alignment and padding_left are None
+    when the style does not set them.
     """
-    styles = []
-    style = get_attr(attrs, "style")
+
+    font: Tuple[Tuple[str, Any], ...]
+    alignment: Optional[int]
+    padding_left: Optional[Pt]
+
+
+@functools.lru_cache(maxsize=STYLE_CACHE_SIZE)
+def parse_style(style: str) -> Style:
+    """Parse a style attribute, caching the result.
+
+    Documents tend to repeat the same few style attributes, the cache is shared by
+    all conversions in the process.
+    """
+    font = []
+    alignment = None
+    padding_left = None
     for style_decl in style_to_css(style):
-        if style_decl["name"] == "text-decoration":
+        name = style_decl["name"]
+        if name == "text-decoration":
             if style_decl["value"] == "underline":
-                styles.append(("underline", True))
+                font.append(("underline", True))
             elif style_decl["value"] == "line-through":
-                styles.append(("strike", True))
-    return styles
+                font.append(("strike", True))
+        elif name == "text-align":
+            alignment = ALIGNMENTS.get(style_decl["value"], WD_ALIGN_PARAGRAPH.LEFT)
+        elif name == "padding-left" and style_decl.get("unit") == "px":
+            padding_left = Pt(style_decl["value"])
+    return Style(tuple(font), alignment, padding_left)
+
+
+def run_font(
+    font: Tuple[Tuple[str, Any], ...], attrs: List[Tuple[str, Any]]
+) -> Tuple[Tuple[str, Any], ...]:
+    """Return the font attributes of a run nested with attrs in a run of font.
+
+    attrs override the attributes of font, and the result is sorted so that equal
+    formattings compare equal. Subscript and superscript set the same vertical
+    alignment, the innermost one wins.
+    """
+    if not attrs:
+        return font
+    merged = dict(font)
+    for font_attr, value in attrs:
+        if value and font_attr in VERT_ALIGN_ATTRS:
+            for other in VERT_ALIGN_ATTRS:
+                merged.pop(other, None)
+        merged[font_attr] = value
+    return tuple(sorted(merged.items()))
+
+
+@functools.lru_cache(maxsize=RUN_PROPERTIES_CACHE_SIZE)
+def run_properties(font: Tuple[Tuple[str, Any], ...]) -> Optional[BaseOxmlElement]:
+    """Return the w:rPr element of a run formatted with the font attributes, None
+    when there are none.
+
+    The element is built once per formatting through the python-docx Font proxy,
+    new runs receive a copy of it. It must not be modified.
+    """
+    r = OxmlElement("w:r")
+    font_proxy = Run(r, None).font
+    for font_attr, value in font:
+        setattr(font_proxy, font_attr, value)
+    return r.rPr
+
+
+def add_text(run: Run, text: str) -> None:
+    """Add text to run, extending its last w:t element when it ends with one."""
+    r = run._r
+    t = r[-1] if len(r) else None
+    if not isinstance(t, CT_Text):
+        r.add_t(text)
+        return
+    text = (t.text or "") + text
+    t.text = text
+    if len(text.strip()) < len(text):
+        t.set(qn("xml:space"), "preserve")
+
+
+def add_image(
+    run: Run,
+    image_data: ImageData,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    shape_id: Optional[int] = None,
+) -> None:
+    """Add a picture to run, like Run.add_picture(), reusing the parsed image.
+
+    Run.add_picture() parses the image and hashes its data again. shape_id defaults
+    to part.next_id, which searches the whole part for the highest id.
+    """
+    part = run.part
+    image_parts = part.package.image_parts
+    image_part = image_parts._get_by_sha1(image_data.digest)
+    if image_part is None:
+        image_part = image_parts._add_image_part(image_data.image)
+    rId = part.relate_to(image_part, RT.IMAGE)
+    image = image_data.image
+    cx, cy = image.scaled_dimensions(width, height)
+    if shape_id is None:
+        shape_id = part.next_id
+    inline = CT_Inline.new_pic_inline(shape_id, rId, image.filename, cx, cy)
+    run._r.add_drawing(inline)
 
 
 class HTML2Docx(HTMLParser):
-    def __init__(self, title: str):
+    """Build a docx document from the HTML fed to the parser.
+
+    External images are fetched in the background while the HTML is parsed, by up to
+    max_workers threads, and inserted in the document by close(). close() must be
+    called once all the content has been fed. External images are retrieved by
+    fetcher, which defaults to a shared HTTPImageFetcher.
+
+    The document is created from template, by default a cached copy of the
+    python-docx default template.
+
+    image_deadline limits the time spent waiting for images, in seconds from the
+    creation of the parser, and max_image_bytes the total size of images downloaded
+    for the document. Images over budget are replaced by the broken image.
+
+    image_loader replaces the ImageLoader built from these arguments. It is used
+    as is: its own instrumentation measures the loading of images.
+
+    broken_images counts the images replaced by the broken image placeholder.
+
+    With merge_runs, text that follows a run with the same formatting in the same
+    paragraph, e.g. in <b>a</b><b>b</b>, is added to that run instead of a new one.
+    merged_runs counts the runs saved.
+
+    With direct_xml, paragraphs and runs are appended to the body as copies of
+    prebuilt lxml elements instead of through the python-docx API. The document is
+    the same.
+
+    With a resampler, images are shrunk to the resolution they are displayed at, see
+    ImageResampler. image_bytes_saved counts the bytes it saved in the document.
+
+    instrumentation, when set, collects the time spent in each phase of the
+    conversion and counts events, see Instrumentation.
+
+    Tags are dispatched to the methods named in start_tags and end_tags, which take
+    the tag, and its attributes for start tags. Tags of run_fonts start and end a
+    run with the given font attributes. Subclasses support more tags by extending
+    these mappings, e.g. run_fonts = {**HTML2Docx.run_fonts, "s": [("strike", True)]}.
+    """
+
+    run_fonts: Dict[str, List[Tuple[str, Any]]] = {
+        "b": [("bold", True)],
+        "code": [("name", "Mono")],
+        "em": [("italic", True)],
+        "i": [("italic", True)],
+        "strong": [("bold", True)],
+        "sub": [("subscript", True)],
+        "sup": [("superscript", True)],
+        "u": [("underline", True)],
+    }
+    start_tags: Dict[str, str] = {
+        "a": "start_a",
+        "br": "start_br",
+        **{f"h{level}": "start_heading" for level in range(1, 7)},
+        "img": "start_img",
+        "li": "start_li",
+        "ol": "start_ol",
+        "p": "start_p",
+        "pre": "start_pre",
+        "span": "start_span",
+        "table": "start_table",
+        "td": "start_tdth",
+        "th": "start_tdth",
+        "tr": "start_tr",
+        "ul": "start_ul",
+    }
+    end_tags: Dict[str, str] = {
+        "a": "end_run",
+        **{f"h{level}": "end_block" for level in range(1, 7)},
+        "li": "end_block",
+        "ol": "end_list",
+        "p": "end_p",
+        "pre": "end_pre",
+        "span": "end_run",
+        "table": "end_table",
+        "td": "end_tdth",
+        "th": "end_tdth",
+        "ul": "end_list",
+    }
+
+    def __init__(
+        self,
+        title: str,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        fetcher: Optional[ImageFetcher] = None,
+        template: Optional[DocumentTemplate] = None,
+        image_loader: Optional[ImageLoader] = None,
+        image_deadline: Optional[float] = None,
+        max_image_bytes: Optional[int] = None,
+        merge_runs: bool = True,
+        direct_xml: bool = False,
+        instrumentation: Optional[Instrumentation] = None,
+        resampler: Optional[ImageResampler] = None,
+    ):
         super().__init__()
-        self.doc = Document()
+        self.instrumentation = instrumentation
+        self.resampler = resampler
+        self.image_bytes_saved = 0
+        if template is None:
+            template = default_template()
+        self.doc = template.new_document()
         self.doc.core_properties.title = title
         self.list_style: List[str] = []
         self.href = ""
+        if image_loader is None:
+            image_loader = ImageLoader(
+                max_workers, fetcher, image_deadline, max_image_bytes, instrumentation
+            )
+        self.images = image_loader
+        self.pictures: List[Tuple[Run, str, Optional[int], Optional[int]]] = []
+        self.table_rows: List[List[CT_Tc]] = []
+        self.merge_runs = merge_runs
+        self.merged_runs = 0
+        self.broken_images = 0
+        # The font of the last run added to the document, to merge the next one.
+        self.last_r: Optional[CT_R] = None
+        self.last_font: Tuple[Tuple[str, Any], ...] = ()
+        self.direct_xml = direct_xml
+        # Paragraph elements by style, alignment and left indent, for direct_xml.
+        self.p_templates: Dict[ParagraphKey, CT_P] = {}
+        self.sectPr = self.doc.element.body.sectPr
+        # python-docx looks the sections up in the whole body on each access.
+        self.block_width = self.doc._block_width
+        section = self.doc.sections[0]
+        self.page_width = (
+            section.page_width - section.left_margin - section.right_margin
+        )
+        self.start_handlers: Dict[str, StartTagHandler] = {
+            tag: self.start_run for tag in self.run_fonts
+        }
+        self.end_handlers: Dict[str, EndTagHandler] = {
+            tag: self.end_run for tag in self.run_fonts
+        }
+        for tag, name in self.start_tags.items():
+            self.start_handlers[tag] = getattr(self, name)
+        for tag, name in self.end_tags.items():
+            self.end_handlers[tag] = getattr(self, name)
         self._reset()
 
+    def feed(self, data: str) -> None:
+        if self.instrumentation is None:
+            super().feed(data)
+            return
+        with self.instrumentation.phase("parse"):
+            super().feed(data)
+
+    def close(self) -> None:
+        if self.instrumentation is None:
+            super().close()
+            self.add_pictures()
+            return
+        with self.instrumentation.phase("parse"):
+            super().close()
+        with self.instrumentation.phase("pictures"):
+            self.add_pictures()
+
     def _reset(self) -> None:
         self.p: Optional[Paragraph] = None
         self.r: Optional[Run] = None
 
         # Formatting options
         self.pre = False
-        self.table: Optional[Tuple[Table, int, int]] = None
+        self.table: Optional[Table] = None
         self.alignment: Optional[int] = None
         self.padding_left: Optional[Pt] = None
         self.attrs: List[List[Tuple[str, Any]]] = []
+        # The font attributes resulting from each level of attrs.
+        self.fonts: List[Tuple[Tuple[str, Any], ...]] = []
         self.collapse_space = True
 
     def init_p(self, attrs: List[Tuple[str, Optional[str]]]) -> None:
@@ -90,78 +358,175 @@ class HTML2Docx(HTMLParser):
         if align:
             self.alignment = ALIGNMENTS.get(align, WD_ALIGN_PARAGRAPH.LEFT)
         style = get_attr(attrs, "style")
-        for style_decl in style_to_css(style):
-            if style_decl["name"] == "text-align":
-                self.alignment = ALIGNMENTS.get(
-                    style_decl["value"], WD_ALIGN_PARAGRAPH.LEFT
-                )
-            elif style_decl["name"] == "padding-left" and style_decl["unit"] == "px":
-                self.padding_left = Pt(style_decl["value"])
+        if not style:
+            return
+        parsed = self.parse_style(style)
+        if parsed.alignment is not None:
+            self.alignment = parsed.alignment
+        if parsed.padding_left is not None:
+            self.padding_left = parsed.padding_left
+
+    def parse_style(self, style: str) -> Style:
+        if self.instrumentation is None:
+            return parse_style(style)
+        with self.instrumentation.phase("css"):
+            return parse_style(style)
 
     def finish_p(self) -> None:
         if self.r is not None:
             self.r.text = self.r.text.rstrip()
+        # Closing a paragraph also closes the current table.
+        self.finish_table()
         self._reset()
 
     def init_table(self, attrs: List[Tuple[str, Optional[str]]]) -> None:
-        self.table = (self.doc.add_table(rows=0, cols=0), -1, -1)
+        self.finish_table()
+        # Like Document.add_table(), without looking the sections and the end of the
+        # body up for each table.
+        tbl = CT_Tbl.new_tbl(0, 0, self.block_width)
+        self.append_block(tbl)
+        self.table = Table(tbl, self.doc._body)
 
     def finish_table(self) -> None:
+        """Write the buffered rows to the table, padded to the widest row.
+
+        Cells are collected in table_rows while parsing, python-docx rebuilds the
+        list of all cells on each Table.cell() call.
+        """
         if self.table is None:
             return
-        section = self.doc.sections[0]
-        page_width = section.page_width - section.left_margin - section.right_margin
-        table = self.table[0]
-        for col in table.columns:
-            col.width = page_width // len(table.columns)
+        if self.instrumentation is None:
+            self.write_table(self.table)
+        else:
+            with self.instrumentation.phase("table"):
+                self.write_table(self.table)
         self.table = None
+        self.table_rows = []
+
+    def write_table(self, table: Table) -> None:
+        tbl = table._tbl
+        cols = max(map(len, self.table_rows), default=0)
+        if cols:
+            for _ in range(cols):
+                tbl.tblGrid.add_gridCol().w = self.page_width // cols
+        for cells in self.table_rows:
+            tr = tbl.add_tr()
+            tr.extend(cells)
+            for _ in range(cols - len(cells)):
+                tr.append(copy.deepcopy(EMPTY_TC))
 
     def init_tr(self) -> None:
         if self.table is None:
             return
-        table, row, col = self.table
-        table.add_row()
-        self.table = table, row + 1, -1
+        self.table_rows.append([])
 
     def init_tdth(self) -> None:
         if self.table is None:
             return
-        table, row, col = self.table
-        col += 1
-        self.table = (table, row, col)
-        if col >= len(table.columns):
-            table.add_column(0)
-        self.p = self.table[0].cell(row, col).paragraphs[0]
+        if not self.table_rows:
+            self.table_rows.append([])
+        tc = copy.deepcopy(EMPTY_TC)
+        self.table_rows[-1].append(tc)
+        self.p = Paragraph(tc.p_lst[0], _Cell(tc, self.table))
         self.r = None
 
     def init_run(self, attrs: List[Tuple[str, Any]]) -> None:
         self.attrs.append(attrs)
+        self.fonts.append(run_font(self.fonts[-1] if self.fonts else (), attrs))
         if attrs:
             self.r = None
 
     def finish_run(self) -> None:
         attrs = self.attrs.pop()
+        self.fonts.pop()
         if attrs:
             self.r = None
 
     def prepare_p(self) -> Paragraph:
         style = self.list_style[-1] if self.list_style else None
-        p = self.doc.add_paragraph(style=style)
-        if self.alignment is not None:
-            p.alignment = self.alignment
-        if self.padding_left:
-            p.paragraph_format.left_indent = self.padding_left
-        return p
+        return self.add_paragraph(style, self.alignment, self.padding_left)
+
+    def add_paragraph(
+        self,
+        style: Optional[str] = None,
+        alignment: Optional[int] = None,
+        left_indent: Optional[Pt] = None,
+    ) -> Paragraph:
+        """Add a paragraph at the end of the document, like Document.add_paragraph()."""
+        if self.instrumentation is not None:
+            self.instrumentation.count("paragraphs")
+        if not self.direct_xml:
+            # Document.add_paragraph() searches the body for the section properties
+            # to insert each paragraph before them.
+            p = OxmlElement("w:p")
+            self.append_block(p)
+            paragraph = Paragraph(p, self.doc._body)
+            if style is not None:
+                paragraph.style = style
+            if alignment is not None:
+                paragraph.alignment = alignment
+            if left_indent:
+                paragraph.paragraph_format.left_indent = left_indent
+            return paragraph
+        key = (style, alignment, left_indent)
+        p_template = self.p_templates.get(key)
+        if p_template is None:
+            # Style ids come from the document, build the template with python-docx.
+            paragraph = Paragraph(copy.deepcopy(EMPTY_P), self.doc._body)
+            if style is not None:
+                paragraph.style = style
+            if alignment is not None:
+                paragraph.alignment = alignment
+            if left_indent:
+                paragraph.paragraph_format.left_indent = left_indent
+            p_template = self.p_templates[key] = paragraph._p
+        p = copy.deepcopy(p_template)
+        self.append_block(p)
+        return Paragraph(p, self.doc._body)
+
+    def append_block(self, element: BaseOxmlElement) -> None:
+        """Append a paragraph or table element at the end of the body."""
+        if self.sectPr is None:
+            self.doc.element.body.append(element)
+        else:
+            self.sectPr.addprevious(element)
+
+    def add_run(self, paragraph: Paragraph, font: Tuple[Tuple[str, Any], ...]) -> Run:
+        """Add a run formatted with font at the end of paragraph."""
+        if self.instrumentation is not None:
+            self.instrumentation.count("runs")
+        if not self.direct_xml:
+            run = paragraph.add_run()
+            rPr = run_properties(font)
+            if rPr is not None:
+                run._r.insert(0, copy.deepcopy(rPr))
+            return run
+        r = etree.SubElement(paragraph._p, qn("w:r"))
+        rPr = run_properties(font)
+        if rPr is not None:
+            r.append(copy.deepcopy(rPr))
+        return Run(r, paragraph)
 
     def add_text(self, data: str) -> None:
         if self.p is None:
             self.p = self.prepare_p()
         if self.r is None:
-            self.r = self.p.add_run()
-            for attrs in self.attrs:
-                for font_attr, value in attrs:
-                    setattr(self.r.font, font_attr, value)
-        self.r.add_text(data)
+            font = self.fonts[-1] if self.fonts else ()
+            last_r = self.last_r
+            if (
+                self.merge_runs
+                and last_r is not None
+                and font == self.last_font
+                and last_r.getparent() is self.p._p
+                and last_r.getnext() is None
+            ):
+                self.r = Run(last_r, self.p)
+                self.merged_runs += 1
+            else:
+                self.r = self.add_run(self.p, font)
+                self.last_r = self.r._r
+                self.last_font = font
+        add_text(self.r, data)
 
     def add_list_style(self, name: str) -> None:
         self.finish_p()
@@ -177,63 +542,120 @@ class HTML2Docx(HTMLParser):
         height_px = int(height_attr) if height_attr else None
         width_px = int(width_attr) if width_attr else None
 
-        image_buffer = load_image(src)
-        size = image_size(image_buffer, width_px, height_px)
-        paragraph = self.doc.add_paragraph()
-        if self.alignment is not None:
-            paragraph.alignment = self.alignment
-        run = paragraph.add_run()
-        run.add_picture(image_buffer, **size)
+        if self.instrumentation is not None:
+            self.instrumentation.count("images")
+        key = self.images.submit(src)
+        paragraph = self.add_paragraph(alignment=self.alignment)
+        run = self.add_run(paragraph, ())
+        self.pictures.append((run, key, width_px, height_px))
 
-    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
-        if tag == "a":
-            self.href = get_attr(attrs, "href")
+    def add_pictures(self) -> None:
+        """Insert the pictures in the runs reserved for them, in document order."""
+        try:
+            # Ids follow the highest one in the document, like successive next_id.
+            shape_ids = itertools.count(self.doc.part.next_id if self.pictures else 1)
+            # Resampled images already counted in image_bytes_saved.
+            resampled: Set[str] = set()
+            for (run, key, width_px, height_px), shape_id in zip(
+                self.pictures, shape_ids
+            ):
+                image_data = self.images.result(key)
+                self.broken_images += image_data.broken
+                size = image_size(image_data, width_px, height_px)
+                if self.resampler is not None:
+                    original = image_data
+                    image_data, size = self.resample(image_data, size)
+                    if (
+                        image_data is not original
+                        and image_data.digest not in resampled
+                    ):
+                        resampled.add(image_data.digest)
+                        self.count_saved(len(original.data) - len(image_data.data))
+                add_image(run, image_data, shape_id=shape_id, **size)
+        finally:
+            self.pictures = []
+            self.images.shutdown()
+
+    def resample(
+        self, image_data: ImageData, size: Dict[str, int]
+    ) -> Tuple[ImageData, Dict[str, int]]:
+        """Return image_data resampled by resampler and its size in the document."""
+        assert self.resampler is not None
+        cx, cy = image_data.image.scaled_dimensions(
+            size.get("width"), size.get("height")
+        )
+        if self.instrumentation is None:
+            resampled = self.resampler.resample(image_data, cx, cy)
+        else:
+            with self.instrumentation.phase("image_resample"):
+                resampled = self.resampler.resample(image_data, cx, cy)
+        if resampled is image_data:
+            return image_data, size
+        # The resampled image has another resolution, keep the original size.
+        return resampled, {"width": cx, "height": cy}
+
+    def count_saved(self, saved: int) -> None:
+        self.image_bytes_saved += saved
+        if self.instrumentation is not None:
+            self.instrumentation.count("image_bytes_saved", saved)
+
+    def start_a(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.href = get_attr(attrs, "href")
+        self.init_run([])
+
+    def start_run(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.init_run(self.run_fonts[tag])
+
+    def start_br(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if self.r:
+            self.r.add_break()
+
+    def start_heading(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.p = self.add_paragraph(f"Heading {tag[-1]}")
+
+    def start_img(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.add_picture(attrs)
+
+    def start_li(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.init_p(attrs)
+        self.p = self.prepare_p()
+
+    def start_ol(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.add_list_style("List Number")
+
+    def start_p(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if self.list_style:
+            if self.p and self.p.runs:
+                self.add_text("\n")
             self.init_run([])
-        elif tag in ["b", "strong"]:
-            self.init_run([("bold", True)])
-        elif tag == "br":
-            if self.r:
-                self.r.add_break()
-        elif tag == "code":
-            self.init_run([("name", "Mono")])
-        elif tag in ["em", "i"]:
-            self.init_run([("italic", True)])
-        elif tag in ["h1", "h2", "h3", "h4", "h5", "h6"]:
-            level = int(tag[-1])
-            self.p = self.doc.add_heading(level=level)
-        elif tag == "img":
-            self.add_picture(attrs)
-        elif tag == "li":
+        else:
             self.init_p(attrs)
-            self.p = self.prepare_p()
-        elif tag == "ol":
-            self.add_list_style("List Number")
-        elif tag == "p":
-            if self.list_style:
-                if self.p and self.p.runs:
-                    self.add_text("\n")
-                self.init_run([])
-            else:
-                self.init_p(attrs)
-        elif tag == "pre":
-            self.pre = True
-        elif tag == "span":
-            span_attrs = html_attrs_to_font_style(attrs)
-            self.init_run(span_attrs)
-        elif tag == "sub":
-            self.init_run([("subscript", True)])
-        elif tag == "sup":
-            self.init_run([("superscript", True)])
-        elif tag == "u":
-            self.init_run([("underline", True)])
-        elif tag == "ul":
-            self.add_list_style("List Bullet")
-        elif tag == "table":
-            self.init_table(attrs)
-        elif tag == "tr":
-            self.init_tr()
-        elif tag in ["td", "th"]:
-            self.init_tdth()
+
+    def start_pre(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.pre = True
+
+    def start_span(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        style = get_attr(attrs, "style")
+        self.init_run(list(self.parse_style(style).font) if style else [])
+
+    def start_ul(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.add_list_style("List Bullet")
+
+    def start_table(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.init_table(attrs)
+
+    def start_tr(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.init_tr()
+
+    def start_tdth(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.init_tdth()
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.count(f"tag.{tag}")
+        handler = self.start_handlers.get(tag)
+        if handler is not None:
+            handler(tag, attrs)
 
     def handle_data(self, data: str) -> None:
         if not self.pre:
@@ -250,19 +672,34 @@ class HTML2Docx(HTMLParser):
             self.collapse_space = data.endswith(" ")
             self.add_text(data)
 
-    def handle_endtag(self, tag: str) -> None:
-        if tag in ["a", "b", "code", "em", "i", "span", "strong", "sub", "sup", "u"]:
-            self.finish_run()
-        elif self.list_style and tag == "p":
+    def end_run(self, tag: str) -> None:
+        self.finish_run()
+
+    def end_p(self, tag: str) -> None:
+        if self.list_style:
             self.collapse_space = True
-        elif tag in ["h1", "h2", "h3", "h4", "h5", "h6", "li", "ol", "p", "pre", "ul"]:
+        else:
             self.finish_p()
-            if tag in ["ol", "ul"]:
-                del self.list_style[-1]
-            elif tag == "pre":
-                self.pre = False
-        elif tag == "table":
-            self.finish_table()
-        elif tag in ["td", "th"]:
-            self.p = None
-            self.r = None
+
+    def end_block(self, tag: str) -> None:
+        self.finish_p()
+
+    def end_list(self, tag: str) -> None:
+        self.finish_p()
+        del self.list_style[-1]
+
+    def end_pre(self, tag: str) -> None:
+        self.finish_p()
+        self.pre = False
+
+    def end_table(self, tag: str) -> None:
+        self.finish_table()
+
+    def end_tdth(self, tag: str) -> None:
+        self.p = None
+        self.r = None
+
+    def handle_endtag(self, tag: str) -> None:
+        handler = self.end_handlers.get(tag)
+        if handler is not None:
+            handler(tag)
@@ -1,17 +1,33 @@
 import base64
 import binascii
+import concurrent.futures
+import contextvars
+import functools
+import hashlib
 import http
+import http.client
 import io
+import os
 import pathlib
+import re
+import ssl
+import sys
+import threading
 import time
 import urllib.error
+import urllib.parse
 import urllib.request
-from typing import Dict, Optional, cast
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 
+from docx.image import SIGNATURES
 from docx.image.exceptions import UnrecognizedImageError
 from docx.image.image import Image
 from docx.shared import Inches
 
+from .cache import DiskCache, FailureCache, LRUCache
+from .instrumentation import Instrumentation, current_instrumentation
+
 # The usable size is the space inside the default template margins.
 # In LibreOffice, the maximum height for an image is capped to USABLE_HEIGHT.
 USABLE_HEIGHT = Inches(8.1)
@@ -19,78 +35,740 @@ USABLE_WIDTH = Inches(5.8)
 DEFAULT_DPI = 72
 
 MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10 MiB
+READ_CHUNK_SIZE = 64 * 1024
+# python-docx recognizes images from the signatures in their first 32 bytes.
+SNIFF_SIZE = 32
+
+# Number of external images fetched concurrently for a single document.
+DEFAULT_MAX_WORKERS = 8
+
+MAX_IDLE_CONNECTIONS_PER_HOST = DEFAULT_MAX_WORKERS
+# Timeout of network operations when fetching an image, in seconds.
+DEFAULT_TIMEOUT = 30.0
+MAX_REDIRECTS = 10
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+REQUEST_HEADERS = {"User-Agent": "Python-urllib/%d.%d" % sys.version_info[:2]}
+# Response validator headers, and the conditional request header they feed.
+VALIDATOR_HEADERS = {"ETag": "If-None-Match", "Last-Modified": "If-Modified-Since"}
 
 RFC_2397_BASE64 = ";base64"
+BASE64_DATA = re.compile("[A-Za-z0-9+/]*={0,2}")
+# Inline images are hashed and decoded by slices of this many characters, a
+# multiple of the 4 characters of a base64 quantum.
+INLINE_CHUNK_SIZE = 1024 * 1024
+
+IMAGE_CACHE_SIZE = 64 * 1024 * 1024  # 64 MiB
+# Seconds during which a URL that could not be retrieved is not requested again.
+DEFAULT_FAILURE_TTL = 60.0
+
+BROKEN_IMAGE_PATH = pathlib.Path(__file__).parent / "image-broken.png"
+
+
+class ImageData(NamedTuple):
+    """An image ready to be added to the document.
+
+    image is the header parsed by python-docx, digest is the SHA-1 of data which
+    python-docx uses to identify image parts. broken is true for the placeholder of
+    an image that could not be loaded.
+    """
 
+    data: bytes
+    image: Image
+    digest: str
+    broken: bool = False
 
-def make_image(data: Optional[bytes]) -> io.BytesIO:
-    image_buffer = None
+
+# Valid images by src, shared by all conversions in the process. The cache assumes
+# that a src always designates the same image, it holds inline images and the
+# images of fetchers with shared_cache. Set max_size to 0 to disable it.
+image_cache: LRUCache[ImageData] = LRUCache(IMAGE_CACHE_SIZE)
+# Guards the creation of the image caches of fetchers.
+fetcher_caches_lock = threading.Lock()
+
+
+def parse_image(data: Optional[bytes]) -> Optional[Image]:
     if data:
-        image_buffer = io.BytesIO(data)
         try:
-            Image.from_blob(image_buffer.getbuffer())
+            return Image.from_blob(data)
         except UnrecognizedImageError:
-            image_buffer = None
+            pass
+    return None
+
+
+def is_image_header(head: bytes) -> bool:
+    """Return whether head starts like an image python-docx can parse."""
+    return any(
+        head.startswith(signature, offset) for _, offset, signature in SIGNATURES
+    )
+
+
+class FetchBudget:
+    """Count the bytes downloaded by a fetch against the max_bytes of its loader."""
+
+    def __init__(self, loader: "ImageLoader"):
+        self.loader = loader
+        self.reserved = 0
+
+    def reserve(self, size: int) -> bool:
+        """Count size more bytes, return False when they exceed the budget."""
+        self.reserved += size
+        return self.loader.reserve(size)
+
+
+# The budget of the fetch running in the current context, so that fetchers shared by
+# all conversions stop downloading once the budget of the document is spent.
+current_budget: "contextvars.ContextVar[Optional[FetchBudget]]" = (
+    contextvars.ContextVar("current_budget", default=None)
+)
+
+
+class BudgetExceeded(Exception):
+    """Raised when a download exceeds the budget of the document it is for.
+
+    The image is not broken, fetchers must not remember its URL as a failure.
+    """
+
+
+def within_budget(size: int) -> bool:
+    """Count size downloaded bytes against the current budget, return whether they
+    fit in it.
+    """
+    budget = current_budget.get()
+    return budget is None or budget.reserve(size)
+
+
+class ImageBuffer:
+    """Collect the data of an image read by chunks.
+
+    add() returns False as soon as the data cannot be a valid image, so that the
+    rest of the response is not read: when its first SNIFF_SIZE bytes do not match
+    a known image format, or when it grows over MAX_IMAGE_SIZE. It raises
+    BudgetExceeded when the data grows over the current budget.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+    def add(self, chunk: bytes) -> bool:
+        sniffed = self.size >= SNIFF_SIZE
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        if not sniffed and self.size >= SNIFF_SIZE:
+            if not is_image_header(b"".join(self.chunks)[:SNIFF_SIZE]):
+                return False
+        if self.size > MAX_IMAGE_SIZE:
+            return False
+        if not within_budget(len(chunk)):
+            raise BudgetExceeded
+        return True
+
+    def getvalue(self) -> Optional[bytes]:
+        data = b"".join(self.chunks)
+        # Data shorter than SNIFF_SIZE has not been sniffed yet.
+        return data if is_image_header(data) else None
+
+
+def read_image(response: http.client.HTTPResponse) -> Optional[bytes]:
+    """Read the image in response by chunks, see ImageBuffer.
+
+    Return None as soon as the data cannot be a valid image, without reading the
+    rest of the response.
+    """
+    buffer = ImageBuffer()
+    chunk = response.read(SNIFF_SIZE)
+    while chunk:
+        if not buffer.add(chunk):
+            return None
+        chunk = response.read(READ_CHUNK_SIZE)
+    return buffer.getvalue()
+
+
+def placeholder_image(data: bytes) -> ImageData:
+    """Return the broken image placeholder made of data."""
+    image = parse_image(data)
+    if image is None:
+        raise ValueError("the broken image placeholder must be an image")
+    return ImageData(data, image, hashlib.sha1(data).hexdigest(), broken=True)
+
+
+@functools.lru_cache(maxsize=None)
+def default_broken_image() -> ImageData:
+    return placeholder_image(BROKEN_IMAGE_PATH.read_bytes())
+
+
+# The placeholder set by set_broken_image(), None for the default one.
+custom_broken_image: Optional[ImageData] = None
+
+
+def set_broken_image(data: Optional[bytes]) -> None:
+    """Replace images that cannot be loaded by the image data, in all conversions of
+    the process. None restores the default placeholder.
+    """
+    global custom_broken_image
+    custom_broken_image = None if data is None else placeholder_image(data)
+
+
+def broken_image() -> ImageData:
+    """Return the placeholder of images that cannot be loaded, parsed once."""
+    if custom_broken_image is not None:
+        return custom_broken_image
+    return default_broken_image()
+
+
+def make_image(data: Optional[bytes]) -> ImageData:
+    image = parse_image(data)
+    if data is None or image is None:
+        return broken_image()
+    return ImageData(data, image, hashlib.sha1(data).hexdigest())
+
+
+def is_failure(src: str, failures: FailureCache) -> bool:
+    """Return whether src failed recently, counting the hit."""
+    if src not in failures:
+        return False
+    instrumentation = current_instrumentation.get()
+    if instrumentation is not None:
+        instrumentation.count("failure_cache_hits")
+    return True
+
+
+class ImageFetcher:
+    """Retrieve the data of external images.
+
+    Subclass and override fetch() to serve images from another source, e.g. an
+    in-memory or local store.
+
+    A src may designate different images for different fetchers, e.g. of different
+    tenants, so the images a fetcher retrieves are cached in a cache of their own,
+    bounded to IMAGE_CACHE_SIZE. Fetchers for which a src always designates the
+    same image set shared_cache to share the process-wide image_cache. It is not
+    inherited: a subclass that may serve other images for the same src, e.g. by
+    overriding fetch(), has its own cache unless it sets shared_cache too.
+    """
+
+    shared_cache = False
+
+    def fetch(self, src: str) -> Optional[bytes]:
+        """Return the data found at src, or None when it cannot be retrieved."""
+        raise NotImplementedError
+
+
+# Scheme, host and port of the server, and the URL of the proxy to reach it through.
+PoolKey = Tuple[str, str, Optional[int], Optional[str]]
+
+
+def get_proxy(scheme: str, host: str) -> Optional[str]:
+    """Return the URL of the proxy configured for scheme and host, as urlopen()
+    would use it, e.g. from the http_proxy, https_proxy and no_proxy environment
+    variables. None means a direct connection.
+    """
+    proxy = urllib.request.getproxies().get(scheme)
+    if not proxy or urllib.request.proxy_bypass(host):
+        return None
+    if "://" not in proxy:
+        proxy = "http://" + proxy
+    return proxy
 
-    if not image_buffer:
-        broken_img_path = pathlib.Path(__file__).parent / "image-broken.png"
-        image_buffer = io.BytesIO(broken_img_path.read_bytes())
 
-    return image_buffer
+def proxy_headers(proxy: str) -> Dict[str, str]:
+    """Return the headers authenticating to proxy with the credentials of its URL."""
+    parts = urllib.parse.urlsplit(proxy)
+    if parts.username is None:
+        return {}
+    credentials = f"{urllib.parse.unquote(parts.username)}:"
+    credentials += urllib.parse.unquote(parts.password or "")
+    token = base64.b64encode(credentials.encode()).decode("ascii")
+    return {"Proxy-Authorization": f"Basic {token}"}
 
 
-def load_external_image(src: str) -> Optional[bytes]:
-    data = None
-    retry = 3
-    while retry and not data:
+class HTTPImageFetcher(ImageFetcher):
+    """Fetch images over HTTP(S), keeping connections alive for reuse.
+
+    Idle connections are pooled per scheme, host and port, so that images served by
+    the same host skip the TCP and TLS handshakes, within a document and across
+    documents. Responses are read by chunks and abandoned, closing the connection,
+    as soon as they turn out not to be an image or to exceed MAX_IMAGE_SIZE. The
+    fetcher is thread-safe. timeout applies to connecting and to each
+    read from the connection, in seconds.
+
+    With a disk_cache, images that carry an ETag or Last-Modified header are stored
+    on disk and revalidated with a conditional request; a 304 Not Modified response
+    reuses the stored image.
+
+    URLs that could not be retrieved are not requested again for failure_ttl
+    seconds, so that a failing host does not cost retries for each occurrence of
+    its images.
+
+    Proxies are configured like for urlopen(), e.g. by the http_proxy,
+    https_proxy and no_proxy environment variables. HTTPS images are fetched
+    through a CONNECT tunnel.
+    """
+
+    # A URL designates the same image for all HTTP fetchers.
+    shared_cache = True
+
+    def __init__(
+        self,
+        max_idle_per_host: int = MAX_IDLE_CONNECTIONS_PER_HOST,
+        disk_cache: Optional[DiskCache] = None,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,
+        failure_ttl: float = DEFAULT_FAILURE_TTL,
+    ):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.disk_cache = disk_cache
+        self.failures = FailureCache(failure_ttl)
+        self.lock = threading.Lock()
+        self.idle: Dict[PoolKey, List[http.client.HTTPConnection]] = {}
+        self.ssl_context: Optional[ssl.SSLContext] = None
+
+    def fetch(self, src: str) -> Optional[bytes]:
+        if is_failure(src, self.failures):
+            return None
         try:
-            with urllib.request.urlopen(src) as response:
-                size = response.getheader("Content-Length")
-                if size and int(size) > MAX_IMAGE_SIZE:
-                    break
-                # Read up to MAX_IMAGE_SIZE when response does not contain
-                # the Content-Length header. The extra byte avoids an extra read to
-                # check whether the EOF was reached.
-                data = cast(bytes, response.read(MAX_IMAGE_SIZE + 1))
-        except (ValueError, http.client.HTTPException, urllib.error.HTTPError):
-            # ValueError: Invalid URL or non-integer Content-Length.
-            # HTTPException: Server does not speak HTTP properly.
-            # HTTPError: Server could not perform request.
-            retry = 0
-        except urllib.error.URLError:
-            # URLError: Transient network error, e.g. DNS request failed.
-            retry -= 1
-            if retry:
-                time.sleep(1)
-        else:
-            if len(data) <= MAX_IMAGE_SIZE:
-                return data
-    return None
+            image_bytes = self.retry(src)
+        except BudgetExceeded:
+            # Another document may have the budget for it.
+            return None
+        if image_bytes is None:
+            self.failures.add(src)
+        return image_bytes
 
+    def retry(self, src: str) -> Optional[bytes]:
+        """Get src, retrying transient network errors."""
+        retry = 3
+        while retry:
+            try:
+                return self.get(src)
+            except (ValueError, http.client.HTTPException, urllib.error.HTTPError):
+                # ValueError: Invalid URL or non-integer Content-Length.
+                # HTTPException: Server does not speak HTTP properly.
+                # HTTPError: Server could not perform request.
+                break
+            except urllib.error.URLError:
+                # URLError: Transient network error, e.g. DNS request failed.
+                retry -= 1
+                if retry:
+                    instrumentation = current_instrumentation.get()
+                    if instrumentation is not None:
+                        instrumentation.count("image_retries")
+                    time.sleep(1)
+            except OSError:
+                # OSError: Connection lost while reading the response.
+                break
+        return None
 
-def load_inline_image(src: str) -> Optional[bytes]:
-    image_data = None
-    header_data = src.split(RFC_2397_BASE64 + ",", maxsplit=1)
-    if len(header_data) == 2:
-        data = header_data[1]
+    def get(self, url: str, redirects: int = MAX_REDIRECTS) -> Optional[bytes]:
+        headers = REQUEST_HEADERS
+        cached = self.disk_cache.get(url) if self.disk_cache is not None else None
+        if cached is not None:
+            headers = dict(headers)
+            for name, header in VALIDATOR_HEADERS.items():
+                if name in cached.metadata:
+                    headers[header] = cached.metadata[name]
+
+        key, conn, response = self.open(url, headers)
         try:
-            image_data = base64.b64decode(data, validate=True)
-        except (binascii.Error, ValueError):
-            # binascii.Error: Character outside of base64 set.
-            # ValueError: Character outside of ASCII.
-            pass
+            location = response.getheader("Location")
+            if response.status in REDIRECT_STATUSES and location and redirects:
+                return self.get(urllib.parse.urljoin(url, location), redirects - 1)
+            if cached is not None and response.status == http.HTTPStatus.NOT_MODIFIED:
+                response.read()
+                return cached.data
+            if not 200 <= response.status < 300:
+                raise urllib.error.HTTPError(
+                    url, response.status, response.reason, response.msg, None
+                )
+            size = response.getheader("Content-Length")
+            if size and int(size) > MAX_IMAGE_SIZE:
+                return None
+            data = read_image(response)
+            if data is None:
+                return None
+        finally:
+            if response.isclosed() and not response.will_close:
+                self.release(key, conn)
+            else:
+                conn.close()
+        if self.disk_cache is not None:
+            self.store(url, data, response)
+        return data
+
+    def store(self, url: str, data: bytes, response: http.client.HTTPResponse) -> None:
+        assert self.disk_cache is not None
+        if "no-store" in (response.getheader("Cache-Control") or ""):
+            return
+        metadata = {}
+        for name in VALIDATOR_HEADERS:
+            value = response.getheader(name)
+            if value:
+                metadata[name] = value
+        # Without validators, the image could never be reused.
+        if metadata:
+            self.disk_cache.set(url, data, metadata)
+
+    def open(
+        self, url: str, headers: Dict[str, str] = REQUEST_HEADERS
+    ) -> Tuple[PoolKey, http.client.HTTPConnection, http.client.HTTPResponse]:
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"unsupported url: {url!r}")
+        proxy = get_proxy(parts.scheme, parts.hostname)
+        key = (parts.scheme, parts.hostname, parts.port, proxy)
+        path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        if proxy is not None and parts.scheme == "http":
+            # The proxy forwards requests for the absolute URL.
+            path = urllib.parse.urlunsplit(
+                parts._replace(path=parts.path or "/", fragment="")
+            )
+            headers = {**headers, **proxy_headers(proxy)}
+        while True:
+            conn = self.acquire(key)
+            reused = conn is not None
+            if conn is None:
+                conn = self.connect(key)
+            try:
+                try:
+                    conn.request("GET", path, headers=headers)
+                except OSError as e:
+                    if reused:
+                        raise
+                    raise urllib.error.URLError(e)
+                return key, conn, conn.getresponse()
+            except ConnectionError:
+                conn.close()
+                if reused:
+                    # The server closed the idle connection, try a new one.
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+    def connect(self, key: PoolKey) -> http.client.HTTPConnection:
+        scheme, host, port, proxy = key
+        if proxy is None:
+            return self.new_connection(scheme, host, port)
+        proxy_parts = urllib.parse.urlsplit(proxy)
+        conn = self.new_connection(scheme, proxy_parts.hostname or "", proxy_parts.port)
+        if scheme == "https":
+            conn.set_tunnel(host, port, headers=proxy_headers(proxy))
+        return conn
+
+    def new_connection(
+        self, scheme: str, host: str, port: Optional[int]
+    ) -> http.client.HTTPConnection:
+        if scheme == "http":
+            return http.client.HTTPConnection(host, port, timeout=self.timeout)
+        if self.ssl_context is None:
+            # Loading the CA certificates is costly, share the context.
+            self.ssl_context = ssl.create_default_context()
+        return http.client.HTTPSConnection(
+            host, port, timeout=self.timeout, context=self.ssl_context
+        )
+
+    def acquire(self, key: PoolKey) -> Optional[http.client.HTTPConnection]:
+        with self.lock:
+            idle = self.idle.get(key)
+            return idle.pop() if idle else None
+
+    def release(self, key: PoolKey, conn: http.client.HTTPConnection) -> None:
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def after_fork(self) -> None:
+        # The idle connections belong to the parent process, sharing their sockets
+        # would mix up the responses.
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.failures.after_fork()
+
+    def close(self) -> None:
+        """Close the idle connections."""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+
+default_fetcher = HTTPImageFetcher()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=default_fetcher.after_fork)
+    os.register_at_fork(after_in_child=image_cache.after_fork)
+
+
+def load_external_image(
+    src: str, fetcher: Optional[ImageFetcher] = None
+) -> Optional[bytes]:
+    if fetcher is None:
+        fetcher = default_fetcher
+    return fetcher.fetch(src)
+
+
+def load_inline_image(src: str) -> Optional[bytes]:
+    """Decode the base64 data of the data: URI src.
+
+    The data is validated in place and decoded by slices, without copying src.
+    Return None when it is invalid or would decode to more than MAX_IMAGE_SIZE.
+    """
+    start = src.find(RFC_2397_BASE64 + ",")
+    if start < 0:
+        return None
+    start += len(RFC_2397_BASE64) + 1
+    size = (len(src) - start) * 3 // 4 - src.endswith("=") - src.endswith("==")
+    if size > MAX_IMAGE_SIZE or not BASE64_DATA.fullmatch(src, start):
+        return None
+    buf = io.BytesIO()
+    try:
+        for offset in range(start, len(src), INLINE_CHUNK_SIZE):
+            end = offset + INLINE_CHUNK_SIZE
+            buf.write(binascii.a2b_base64(src[offset:end]))
+    except binascii.Error:
+        # Incorrect padding.
+        return None
+    # Returns the buffer of buf without copying it.
+    return buf.getvalue()
+
+
+def inline_image_key(src: str) -> str:
+    """Return a key identifying the data: URI src, much shorter than src."""
+    digest = hashlib.sha1()
+    for offset in range(0, len(src), INLINE_CHUNK_SIZE):
+        end = offset + INLINE_CHUNK_SIZE
+        digest.update(src[offset:end].encode("utf-8", "surrogatepass"))
+    return "data:" + digest.hexdigest()
+
+
+def shares_image_cache(fetcher: object) -> bool:
+    """Return whether the images retrieved by fetcher, an ImageFetcher or an
+    AsyncImageFetcher, are the same as for the default fetcher. None stands for the
+    default fetcher.
+    """
+    if fetcher is None:
+        return True
+    # Set by the class of fetcher itself, see ImageFetcher.
+    return bool(vars(type(fetcher)).get("shared_cache", False))
+
+
+def fetcher_cache(fetcher: object) -> LRUCache[ImageData]:
+    """Return the cache of the images retrieved by fetcher, an ImageFetcher or an
+    AsyncImageFetcher. None stands for the default fetcher.
+    """
+    if shares_image_cache(fetcher):
+        return image_cache
+    with fetcher_caches_lock:
+        cache: Optional[LRUCache[ImageData]] = getattr(fetcher, "_image_cache", None)
+        if cache is None:
+            cache = LRUCache(IMAGE_CACHE_SIZE)
+            setattr(fetcher, "_image_cache", cache)
+        return cache
+
+
+def cache_image(
+    src: str, image_bytes: Optional[bytes], cache: LRUCache[ImageData] = image_cache
+) -> ImageData:
+    """Validate the data loaded from src, and cache it when it is a valid image."""
+    image = parse_image(image_bytes)
+    if image_bytes is None or image is None:
+        return broken_image()
+    digest = hashlib.sha1(image_bytes).hexdigest()
+    image_data = ImageData(image_bytes, image, digest)
+    cache.set(src, image_data, len(src) + len(image_bytes))
     return image_data
 
 
-def load_image(src: str) -> io.BytesIO:
-    image_bytes = (
-        load_inline_image(src) if src.startswith("data:") else load_external_image(src)
-    )
-    return make_image(image_bytes)
+def load_image(src: str, fetcher: Optional[ImageFetcher] = None) -> ImageData:
+    inline = src.startswith("data:")
+    key = inline_image_key(src) if inline else src
+    cache = image_cache if inline else fetcher_cache(fetcher)
+    image_data = cache.get(key)
+    if image_data is None:
+        image_bytes = (
+            load_inline_image(src) if inline else load_external_image(src, fetcher)
+        )
+        image_data = cache_image(key, image_bytes, cache)
+    return image_data
+
+
+class ImageLoader:
+    """Load the images of a document, fetching external images concurrently.
+
+    Images are requested with submit() as soon as they are found in the document and
+    collected with result() once the document has been parsed, so that fetching
+    overlaps with parsing and with the other fetches. Each src is loaded once.
+    Inline images are identified by a hash of their data: URI, so that identical
+    ones are decoded once and the loader does not keep their URIs.
+
+    With max_workers set to 0, images are loaded synchronously on submit(). External
+    images are retrieved by fetcher, the shared HTTPImageFetcher by default.
+
+    Fetching can be limited for the document: deadline is the time in seconds,
+    counted from the creation of the loader, after which images are no longer
+    awaited, and max_bytes the total size of images downloaded. Images over these
+    budgets are replaced by the broken image. The HTTP fetchers count the bytes as
+    they read them and abandon the download that exceeds max_bytes, so that
+    concurrent downloads exceed it by at most a read each. Other fetchers are
+    counted once they return the image.
+
+    instrumentation, when set, measures the loading of images.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        fetcher: Optional[ImageFetcher] = None,
+        deadline: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        instrumentation: Optional[Instrumentation] = None,
+    ):
+        self.max_workers = max_workers
+        self.fetcher = fetcher
+        self.cache = fetcher_cache(fetcher)
+        self.instrumentation = instrumentation
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.futures: Dict[str, "Future[ImageData]"] = {}
+        self.deadline = None if deadline is None else time.monotonic() + deadline
+        self.max_bytes = max_bytes
+        self.bytes_loaded = 0
+        self.lock = threading.Lock()
+
+    def submit(self, src: str) -> str:
+        """Start loading src, return the key to pass to result()."""
+        if src.startswith("data:"):
+            key = inline_image_key(src)
+            if key not in self.futures:
+                # Inline images are decoded without I/O, there is nothing to overlap.
+                future: "Future[ImageData]" = Future()
+                future.set_result(self.load_inline(key, src))
+                self.futures[key] = future
+            return key
+        if src in self.futures:
+            return src
+        if self.max_workers < 1:
+            future = Future()
+            future.set_result(self.load(src))
+        else:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="html2docx-image"
+                )
+            future = self.executor.submit(self.load, src)
+        self.futures[src] = future
+        return src
+
+    def load(self, src: str) -> ImageData:
+        image_data = self.cached(src)
+        if image_data is not None:
+            return image_data
+        image_bytes = None
+        if not self.over_budget():
+            budget = FetchBudget(self)
+            token = current_budget.set(budget)
+            try:
+                image_bytes = self.fetch(src)
+            finally:
+                current_budget.reset(token)
+            image_bytes = self.spend(image_bytes, budget)
+        return self.validate(src, image_bytes)
+
+    def load_inline(self, key: str, src: str) -> ImageData:
+        image_data = self.cached(key)
+        if image_data is None:
+            image_data = self.validate(key, load_inline_image(src))
+        return image_data
+
+    def cache_of(self, key: str) -> LRUCache[ImageData]:
+        # Inline images do not depend on the fetcher.
+        return image_cache if key.startswith("data:") else self.cache
+
+    def cached(self, src: str) -> Optional[ImageData]:
+        image_data = self.cache_of(src).get(src)
+        if image_data is not None and self.instrumentation is not None:
+            self.instrumentation.count("image_cache_hits")
+        return image_data
+
+    def fetch(self, src: str) -> Optional[bytes]:
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return load_external_image(src, self.fetcher)
+        token = current_instrumentation.set(instrumentation)
+        try:
+            with instrumentation.phase("image_fetch"):
+                image_bytes = load_external_image(src, self.fetcher)
+        finally:
+            current_instrumentation.reset(token)
+        self.count_fetched(image_bytes)
+        return image_bytes
+
+    def count_fetched(self, image_bytes: Optional[bytes]) -> None:
+        assert self.instrumentation is not None
+        self.instrumentation.count("images_fetched")
+        if image_bytes is not None:
+            self.instrumentation.count("image_bytes", len(image_bytes))
+
+    def validate(self, src: str, image_bytes: Optional[bytes]) -> ImageData:
+        cache = self.cache_of(src)
+        if self.instrumentation is None:
+            return cache_image(src, image_bytes, cache)
+        with self.instrumentation.phase("image_parse"):
+            return cache_image(src, image_bytes, cache)
+
+    def over_budget(self) -> bool:
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return True
+        return self.max_bytes is not None and self.bytes_loaded >= self.max_bytes
+
+    def reserve(self, size: int) -> bool:
+        """Count size downloaded bytes, return False when they exceed max_bytes."""
+        if self.max_bytes is None:
+            return True
+        with self.lock:
+            self.bytes_loaded += size
+            return self.bytes_loaded <= self.max_bytes
+
+    def spend(
+        self, image_bytes: Optional[bytes], budget: FetchBudget
+    ) -> Optional[bytes]:
+        """Count the part of image_bytes that budget did not count while downloading
+        it, return None when over budget.
+        """
+        if image_bytes is None:
+            return None
+        unreserved = len(image_bytes) - budget.reserved
+        if unreserved > 0 and not budget.reserve(unreserved):
+            return None
+        return image_bytes
+
+    def result(self, key: str) -> ImageData:
+        """Return the image submitted as key, or load the image at key."""
+        if key not in self.futures:
+            key = self.submit(key)
+        future = self.futures[key]
+        timeout = None
+        if self.deadline is not None:
+            timeout = max(0.0, self.deadline - time.monotonic())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return broken_image()
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        self.futures.clear()
 
 
 def image_size(
-    image_buffer: io.BytesIO,
+    image_data: Union[ImageData, io.BytesIO],
     width_px: Optional[int] = None,
     height_px: Optional[int] = None,
 ) -> Dict[str, int]:
@@ -103,7 +781,10 @@ def image_size(
         Single dimension (width or height): image ratio is expected to be maintained
         Two dimensions (width and height): image should be resized to dimensions
     """
-    image = Image.from_blob(image_buffer.getbuffer())
+    if isinstance(image_data, ImageData):
+        image = image_data.image
+    else:
+        image = Image.from_blob(image_data.getbuffer())
 
     # Normalize image size to inches.
     # - Without a specified pixel size, images are their actual pixel size, so that
@@ -0,0 +1,75 @@
+import contextlib
+import contextvars
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import DefaultDict, Iterator, Optional
+
+
+class Instrumentation:
+    """Collect the time spent in each phase of conversions, and event counters.
+
+    Pass an instance as instrumentation to html2docx() or HTML2Docx. It can be
+    shared by several conversions, including concurrent ones, to aggregate them.
+
+    phases maps phase names to their wall time in seconds:
+      - parse: feeding the HTML to the parser, which builds the document and
+        includes css and table.
+      - css: parsing style attributes.
+      - table: writing table rows to the document.
+      - image_fetch: retrieving external images, retries included. Images are
+        fetched concurrently, this is the sum of the time of each fetch.
+      - image_parse: parsing image headers.
+      - image_resample: resampling images, with a resampler.
+      - pictures: waiting for images and adding them to the document, once the
+        HTML has been parsed.
+      - save: writing the docx package.
+      - merge: appending the chunks converted by the workers of
+        html2docx_parallel(), whose parse, css and table phases add up the time of
+        the workers.
+
+    counters maps event names to their counts: tag.<name> for each start tag,
+    paragraphs, runs, images, images_fetched, image_bytes downloaded,
+    image_cache_hits, failure_cache_hits for images that failed recently,
+    image_retries, image_bytes_saved by the resampler and result_cache_hits.
+
+    Subclass and override on_phase() and on_count() to forward the measures, e.g.
+    to a metrics system. They are called as the measures are taken, from the
+    threads taking them.
+    """
+
+    def __init__(self) -> None:
+        self.phases: DefaultDict[str, float] = defaultdict(float)
+        self.counters: "Counter[str]" = Counter()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.phases[name] += seconds
+        self.on_phase(name, seconds)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += n
+        self.on_count(name, n)
+
+    def on_phase(self, name: str, seconds: float) -> None:
+        """Called when a phase of seconds ends."""
+
+    def on_count(self, name: str, n: int) -> None:
+        """Called when n events occur."""
+
+
+# The instrumentation of the conversion an image is fetched for, so that fetchers
+# shared by all conversions report to it.
+current_instrumentation: "contextvars.ContextVar[Optional[Instrumentation]]" = (
+    contextvars.ContextVar("current_instrumentation", default=None)
+)
@@ -0,0 +1,49 @@
+import os
+import zipfile
+from typing import IO, Union
+
+from docx.document import Document
+from docx.opc.packuri import PackURI
+from docx.opc.pkgwriter import PackageWriter
+
+# The earliest date a zip file can store, as used by reproducible builds.
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+Destination = Union[str, "os.PathLike[str]", IO[bytes]]
+
+
+class ZipPackageWriter:
+    """Write the members of a docx package, stamped with ZIP_DATE_TIME.
+
+    python-docx stamps them with the current time, so that the same document
+    saved twice gives different bytes.
+    """
+
+    def __init__(self, file: Destination):
+        self.zipf = zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def write(self, pack_uri: PackURI, blob: bytes) -> None:
+        info = zipfile.ZipInfo(pack_uri.membername, ZIP_DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o600 << 16
+        self.zipf.writestr(info, blob)
+
+    def close(self) -> None:
+        self.zipf.close()
+
+
+def save_document(doc: Document, file: Destination) -> None:
+    """Save doc to file, like Document.save(), always producing the same bytes for
+    the same document.
+    """
+    package = doc.part.package
+    parts = list(package.parts)
+    for part in parts:
+        part.before_marshal()
+    writer = ZipPackageWriter(file)
+    try:
+        PackageWriter._write_content_types_stream(writer, parts)
+        PackageWriter._write_pkg_rels(writer, package.rels)
+        PackageWriter._write_parts(writer, parts)
+    finally:
+        writer.close()
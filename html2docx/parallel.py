@@ -0,0 +1,243 @@
+import concurrent.futures
+import os
+from html.parser import HTMLParser
+from io import BytesIO
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from docx.oxml import element_class_lookup
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from lxml import etree
+
+from . import batch, html2docx, save
+from .batch import TemplatePath, init_worker
+from .html2docx import HTML2Docx
+from .image import ImageLoader
+from .instrumentation import Instrumentation
+from .template import DocumentTemplate, default_template
+
+# Inputs are split in chunks of about this many characters.
+DEFAULT_CHUNK_SIZE = 256 * 1024
+# Options of HTML2Docx that shape the body built by the workers. The other options
+# apply to images, which are added by the calling process.
+WORKER_OPTIONS = ("direct_xml", "merge_runs")
+
+HEADINGS = {f"h{level}" for level in range(1, 7)}
+# Top-level elements the input is split before.
+SPLIT_TAGS = {"ol", "p", "pre", "table", "ul", *HEADINGS}
+# End tags that leave the parser in its initial state, see HTML2Docx.finish_p().
+RESET_TAGS = {"ol", "p", "pre", "ul", *HEADINGS}
+# Tags that change the state of the parser until they end.
+NESTING_TAGS = set(HTML2Docx.end_tags) | set(HTML2Docx.run_fonts)
+HANDLED_TAGS = set(HTML2Docx.start_tags) | NESTING_TAGS
+
+# Like docx.oxml.oxml_parser, but keeps the blank text of the elements built from
+# python-docx templates, so that merged bodies are the same as serial ones.
+chunk_parser = etree.XMLParser(resolve_entities=False)
+chunk_parser.set_element_class_lookup(element_class_lookup)
+
+
+class Splitter(HTMLParser):
+    """Find where HTML can be split in chunks converted independently.
+
+    A chunk starts with a top-level element of SPLIT_TAGS, where the state of
+    HTML2Docx would be the same as for a new document: right after a top-level
+    element of RESET_TAGS, with no text in between. splits are the offsets of the
+    chunks after the first one, chunk_size characters apart or more.
+    """
+
+    def __init__(self, content: str, chunk_size: int):
+        super().__init__()
+        self.chunk_size = chunk_size
+        self.splits: List[int] = []
+        self.next_split = chunk_size
+        # The offset of each line, to turn positions into offsets.
+        self.lines = [0]
+        offset = content.find("\n")
+        while offset >= 0:
+            self.lines.append(offset + 1)
+            offset = content.find("\n", offset + 1)
+        self.open_tags: List[str] = []
+        self.initial = True
+        # An <a> sets an href that the parser appends to the next text.
+        self.href = False
+
+    def position(self) -> int:
+        lineno, column = self.getpos()
+        return self.lines[lineno - 1] + column
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag not in HANDLED_TAGS:
+            return
+        if not self.open_tags:
+            if tag in SPLIT_TAGS and self.initial and not self.href:
+                offset = self.position()
+                if offset >= self.next_split:
+                    self.splits.append(offset)
+                    self.next_split = offset + self.chunk_size
+            self.initial = False
+        if tag == "a":
+            self.href = any(name == "href" and value for name, value in attrs)
+        if tag in NESTING_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag not in self.open_tags:
+            return
+        while self.open_tags.pop() != tag:
+            pass
+        if not self.open_tags:
+            self.initial = tag in RESET_TAGS
+
+    def handle_data(self, data: str) -> None:
+        if data.strip():
+            self.href = False
+            if not self.open_tags:
+                self.initial = False
+
+
+def split_html(content: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[str]:
+    """Split content in chunks of about chunk_size characters, which convert to the
+    same body as content when their bodies are concatenated.
+    """
+    splitter = Splitter(content, chunk_size)
+    splitter.feed(content)
+    splitter.close()
+    bounds = [0, *splitter.splits, len(content)]
+    return [content[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+class Chunk(NamedTuple):
+    """The body converted from a chunk: its elements serialized in a w:body, the
+    pictures to insert as (index of the reserved w:r in the body, src, width_px,
+    height_px), the number of runs merged, and the counters and phases of the
+    worker instrumentation, empty when not instrumented.
+    """
+
+    body: bytes
+    pictures: List[Tuple[int, str, Optional[int], Optional[int]]]
+    merged_runs: int
+    counters: Dict[str, int]
+    phases: Dict[str, float]
+
+
+class DeferredImageLoader(ImageLoader):
+    """Keep the src of images, which are loaded by the process merging the chunks."""
+
+    def submit(self, src: str) -> str:
+        return src
+
+
+def convert_chunk(
+    content: str, options: Dict[str, Any], instrumented: bool = False
+) -> Chunk:
+    instrumentation = Instrumentation() if instrumented else None
+    parser = HTML2Docx(
+        "",
+        template=batch.worker_template,
+        image_loader=DeferredImageLoader(0),
+        instrumentation=instrumentation,
+        **options,
+    )
+    parser.feed(content)
+    # Flush the parser without adding the pictures.
+    if instrumentation is None:
+        HTMLParser.close(parser)
+    else:
+        with instrumentation.phase("parse"):
+            HTMLParser.close(parser)
+    body = parser.doc.element.body
+    if parser.sectPr is not None:
+        body.remove(parser.sectPr)
+    pictures = []
+    if parser.pictures:
+        runs = {r: index for index, r in enumerate(body.iter(qn("w:r")))}
+        pictures = [
+            (runs[run._r], src, width_px, height_px)
+            for run, src, width_px, height_px in parser.pictures
+        ]
+    counters: Dict[str, int] = {}
+    phases: Dict[str, float] = {}
+    if instrumentation is not None:
+        counters = dict(instrumentation.counters)
+        phases = dict(instrumentation.phases)
+    return Chunk(etree.tostring(body), pictures, parser.merged_runs, counters, phases)
+
+
+def merge_chunk(parser: HTML2Docx, chunk: Chunk) -> None:
+    """Append the body of chunk to the document of parser, reserve its pictures and
+    add the measures of the worker to the instrumentation of parser.
+    """
+    body = etree.fromstring(chunk.body, chunk_parser)
+    if chunk.pictures:
+        runs = list(body.iter(qn("w:r")))
+        for index, src, width_px, height_px in chunk.pictures:
+            r = runs[index]
+            run = Run(r, Paragraph(r.getparent(), parser.doc._body))
+            key = parser.images.submit(src)
+            parser.pictures.append((run, key, width_px, height_px))
+    for element in list(body):
+        parser.append_block(element)
+    parser.merged_runs += chunk.merged_runs
+    if parser.instrumentation is not None:
+        for name, n in chunk.counters.items():
+            parser.instrumentation.count(name, n)
+        for name, seconds in chunk.phases.items():
+            parser.instrumentation.add_time(name, seconds)
+
+
+def html2docx_parallel(
+    content: str,
+    title: str,
+    max_workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    template: Optional[TemplatePath] = None,
+    **kwargs: Any,
+) -> BytesIO:
+    """Convert valid HTML content to a docx document in a pool of max_workers
+    processes and return it as a io.BytesIO() object.
+
+    content is split between top-level paragraphs, headings, lists and tables in
+    chunks of about chunk_size characters, converted by the workers. Their bodies
+    are merged in the calling process, which then adds the images, as html2docx()
+    would. The document is the same as the one html2docx() returns. template is a
+    docx path, loaded by each worker. max_workers set to 0 or 1 converts content
+    in the calling process, like convert_many() does with 0.
+
+    Extra keyword arguments are passed to HTML2Docx. Only merge_runs and direct_xml
+    are passed to the workers. With an instrumentation, the workers measure their
+    chunks and their counters and phases are added to it as the chunks are merged:
+    parse, css and table sum the time of the workers, not the wall time of the
+    conversion, and merge is the time spent appending the chunks.
+    """
+    content = content.strip()
+    doc_template = DocumentTemplate(template) if template else default_template()
+    chunks = split_html(content, chunk_size)
+    if len(chunks) < 2 or max_workers in (0, 1):
+        return html2docx(content, title, template=doc_template, **kwargs)
+
+    parser = HTML2Docx(title, template=doc_template, **kwargs)
+    options = {name: kwargs[name] for name in WORKER_OPTIONS if name in kwargs}
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(
+        min(max_workers, len(chunks)), initializer=init_worker, initargs=(template,)
+    ) as executor:
+        instrumented = parser.instrumentation is not None
+        futures = [
+            executor.submit(convert_chunk, chunk, options, instrumented)
+            for chunk in chunks
+        ]
+        # Chunks are merged in order, images are fetched while the others convert.
+        for future in futures:
+            converted = future.result()
+            if parser.instrumentation is None:
+                merge_chunk(parser, converted)
+            else:
+                with parser.instrumentation.phase("merge"):
+                    merge_chunk(parser, converted)
+    parser.close()
+    buf = BytesIO()
+    save(parser, buf)
+    return buf
@@ -0,0 +1,131 @@
+import hashlib
+import io
+from typing import Optional, Tuple
+
+from docx.image.image import Image
+from docx.shared import Inches
+
+from .cache import LRUCache
+from .image import ImageData
+
+try:
+    import PIL.Image
+
+    # Pillow 9.1 moved the resampling filters to an enum.
+    LANCZOS = getattr(PIL.Image, "Resampling", PIL.Image).LANCZOS
+except ImportError:  # pragma: no cover
+    PIL = None  # type: ignore[assignment]
+
+DEFAULT_MAX_DPI = 150
+DEFAULT_JPEG_QUALITY = 85
+# Images with more colors are photos, which JPEG compresses better than PNG.
+PHOTO_MIN_COLORS = 256
+
+RESAMPLE_CACHE_SIZE = 32 * 1024 * 1024  # 32 MiB
+
+
+class ImageResampler:
+    """Shrink images to the resolution they are displayed at.
+
+    Images are resampled so that they do not exceed max_dpi at their size in the
+    document, and re-encoded: JPEG images as JPEG with jpeg_quality, other images
+    as PNG. With photos_as_jpeg, opaque images of more than PHOTO_MIN_COLORS colors
+    are re-encoded as JPEG too, even when they are not resampled. An image is only
+    replaced when the result is smaller.
+
+    Requires Pillow, e.g. pip install html2docx[resample]. The resampler is
+    thread-safe and can be shared by conversions; it keeps the resampled images in
+    a cache bounded to cache_size bytes.
+    """
+
+    def __init__(
+        self,
+        max_dpi: int = DEFAULT_MAX_DPI,
+        jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+        photos_as_jpeg: bool = False,
+        cache_size: int = RESAMPLE_CACHE_SIZE,
+    ):
+        if PIL is None:
+            raise ImportError("ImageResampler requires Pillow")
+        self.max_dpi = max_dpi
+        self.jpeg_quality = jpeg_quality
+        self.photos_as_jpeg = photos_as_jpeg
+        self.cache: LRUCache[ImageData] = LRUCache(cache_size)
+
+    @property
+    def options(self) -> Tuple[int, int, bool]:
+        """The options that decide the resampled images."""
+        return self.max_dpi, self.jpeg_quality, self.photos_as_jpeg
+
+    def resample(self, image_data: ImageData, cx: int, cy: int) -> ImageData:
+        """Return image_data resampled for display at cx by cy EMU, or image_data
+        itself when it cannot be made smaller.
+        """
+        if image_data.broken:
+            return image_data
+        image = image_data.image
+        size = (
+            min(image.px_width, max(1, round(cx * self.max_dpi / Inches(1)))),
+            min(image.px_height, max(1, round(cy * self.max_dpi / Inches(1)))),
+        )
+        resize = size != (image.px_width, image.px_height)
+        if not resize and not self.photos_as_jpeg:
+            return image_data
+        key = f"{image_data.digest}:{size[0]}x{size[1]}"
+        resampled = self.cache.get(key)
+        if resampled is None:
+            data = self.encode(image_data.data, size if resize else None)
+            if data is None or len(data) >= len(image_data.data):
+                resampled = image_data
+                self.cache.set(key, resampled, len(key))
+            else:
+                digest = hashlib.sha1(data).hexdigest()
+                resampled = ImageData(data, Image.from_blob(data), digest)
+                self.cache.set(key, resampled, len(key) + len(data))
+        return resampled
+
+    def encode(self, data: bytes, size: Optional[Tuple[int, int]]) -> Optional[bytes]:
+        """Return data resized to size and re-encoded, None when Pillow cannot."""
+        try:
+            with PIL.Image.open(io.BytesIO(data)) as source:
+                if getattr(source, "is_animated", False):
+                    return None
+                image_format = source.format
+                if size is None and image_format == "JPEG":
+                    # Re-encoding alone would only lose quality.
+                    return None
+                if size is not None:
+                    # JPEG images can be decoded directly at a fraction of their size.
+                    source.draft("RGB", size)
+                img = opaque(source)
+                if size is not None:
+                    img = img.resize(size, LANCZOS)
+                buf = io.BytesIO()
+                dpi = (self.max_dpi, self.max_dpi)
+                if img.mode in ("L", "RGB") and (
+                    image_format == "JPEG" or (self.photos_as_jpeg and is_photo(img))
+                ):
+                    img.save(buf, "JPEG", quality=self.jpeg_quality, dpi=dpi)
+                else:
+                    img.save(buf, "PNG", dpi=dpi)
+                return buf.getvalue()
+        except (OSError, ValueError, PIL.Image.DecompressionBombError):
+            # OSError: Truncated image or format Pillow cannot read or write.
+            # ValueError: Unsupported mode or parameter for the format.
+            return None
+
+
+def opaque(img: "PIL.Image.Image") -> "PIL.Image.Image":
+    """Return img in a mode that can be resampled, without its alpha channel when
+    it is fully opaque.
+    """
+    if img.mode in ("RGBA", "LA") and img.getchannel("A").getextrema() == (255, 255):
+        return img.convert(img.mode[:-1])
+    if img.mode in ("L", "LA", "RGB", "RGBA"):
+        return img
+    transparent = "A" in img.mode or "transparency" in img.info
+    return img.convert("RGBA" if transparent else "RGB")
+
+
+def is_photo(img: "PIL.Image.Image") -> bool:
+    return img.getcolors(PHOTO_MIN_COLORS) is None
@@ -0,0 +1,48 @@
+import copy
+import functools
+import hashlib
+import io
+import os
+import threading
+from typing import IO, Optional, Union
+
+from docx import Document
+from docx.document import Document as DocumentObject
+
+from .package import save_document
+
+
+class DocumentTemplate:
+    """A docx package loaded once, from which documents are created cheaply.
+
+    new_document() returns a deep copy of the loaded document, which is several times
+    faster than opening and parsing the package again. docx is a path or a binary
+    file object, the python-docx default template when omitted.
+
+    digest identifies the content of the template, for result caches.
+    """
+
+    def __init__(self, docx: Union[str, "os.PathLike[str]", IO[bytes], None] = None):
+        if isinstance(docx, os.PathLike):
+            docx = os.fspath(docx)
+        self.document = Document(docx)
+        self.lock = threading.Lock()
+        self._digest: Optional[str] = None
+
+    def new_document(self) -> DocumentObject:
+        with self.lock:
+            return copy.deepcopy(self.document)
+
+    @property
+    def digest(self) -> str:
+        with self.lock:
+            if self._digest is None:
+                buf = io.BytesIO()
+                save_document(self.document, buf)
+                self._digest = hashlib.sha256(buf.getvalue()).hexdigest()
+            return self._digest
+
+
+@functools.lru_cache(maxsize=None)
+def default_template() -> DocumentTemplate:
+    return DocumentTemplate()
@@ -1,7 +1,9 @@
 import http.server
 import os
+import socketserver
 import sys
 import threading
+import urllib.parse
 
 import pytest
 
@@ -16,16 +18,21 @@ class CountingHTTPServer(http.server.HTTPServer):
         return super().finish_request(*args, **kwargs)
 
 
+class ThreadingCountingHTTPServer(socketserver.ThreadingMixIn, CountingHTTPServer):
+    daemon_threads = True
+
+
 class HttpServerThread(threading.Thread):
-    def __init__(self, handler):
+    def __init__(self, handler, server_class=CountingHTTPServer):
         super().__init__()
         self.is_ready = threading.Event()
         self.handler = handler
+        self.server_class = server_class
         self.error = None
 
     def run(self):
         try:
-            self.httpd = CountingHTTPServer(("localhost", 0), self.handler)
+            self.httpd = self.server_class(("localhost", 0), self.handler)
             port = self.httpd.server_address[1]
             self.base_url = f"http://localhost:{port}/"
             self.is_ready.set()
@@ -60,8 +67,8 @@ class ImageHandler(http.server.SimpleHTTPRequestHandler):
         return super().translate_path(path)
 
 
-def http_server_thread(handler):
-    server_thread = HttpServerThread(handler)
+def http_server_thread(handler, server_class=CountingHTTPServer):
+    server_thread = HttpServerThread(handler, server_class)
     server_thread.daemon = True
     server_thread.start()
     server_thread.is_ready.wait()
@@ -81,6 +88,78 @@ def image_server():
     yield from http_server_thread(ImageHandler)
 
 
+class KeepAliveImageHandler(ImageHandler):
+    protocol_version = "HTTP/1.1"
+
+
+@pytest.fixture(scope="function")
+def keep_alive_image_server():
+    yield from http_server_thread(KeepAliveImageHandler, ThreadingCountingHTTPServer)
+
+
+class ProxyHandler(ImageHandler):
+    """Serve the images of any host, like a forward proxy."""
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        self.server.proxy_authorization = self.headers["Proxy-Authorization"]
+        self.server.host = self.headers["Host"]
+        super().do_GET()
+
+    def do_CONNECT(self):
+        # Tunnels are refused, the requests are recorded only.
+        self.server.paths.append(self.path)
+        self.server.proxy_authorization = self.headers["Proxy-Authorization"]
+        self.send_error(http.HTTPStatus.BAD_GATEWAY)
+
+    def translate_path(self, path):
+        return super().translate_path(urllib.parse.urlsplit(path).path)
+
+
+@pytest.fixture(scope="function")
+def proxy_server():
+    for server in http_server_thread(ProxyHandler):
+        server.httpd.paths = []
+        yield server
+
+
+class ETagImageHandler(http.server.BaseHTTPRequestHandler):
+    etag = '"1x1"'
+
+    def do_GET(self):
+        if self.headers["If-None-Match"] == self.etag:
+            self.send_response(http.HTTPStatus.NOT_MODIFIED)
+            self.end_headers()
+            return
+        data = (TEST_DIR / "images" / "1x1.png").read_bytes()
+        self.send_response(http.HTTPStatus.OK)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", self.etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture(scope="function")
+def etag_image_server():
+    yield from http_server_thread(ETagImageHandler)
+
+
+class RedirectHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        target = f"http://localhost:{self.server.target_port}{self.path}"
+        self.send_response(http.HTTPStatus.FOUND)
+        self.send_header("Location", target)
+        self.end_headers()
+
+
+@pytest.fixture(scope="function")
+def redirect_server(image_server):
+    for server in http_server_thread(RedirectHandler):
+        server.httpd.target_port = image_server.httpd.server_address[1]
+        yield server
+
+
 class BadContentHandler(http.server.SimpleHTTPRequestHandler):
     def do_GET(self):
         self.close_connection = True
@@ -101,3 +180,65 @@ class BadContentLengthHandler(http.server.SimpleHTTPRequestHandler):
 @pytest.fixture(scope="function")
 def bad_content_length_server():
     yield from http_server_thread(BadContentLengthHandler)
+
+
+class EndlessImageHandler(http.server.BaseHTTPRequestHandler):
+    """Stream a PNG header followed by data until the client goes away."""
+
+    def do_GET(self):
+        self.send_response(http.HTTPStatus.OK)
+        self.send_header("Content-Type", "image/png")
+        self.end_headers()
+        self.server.bytes_sent = 0
+        chunk = b"\x89PNG\r\n\x1a\n" + bytes(64 * 1024)
+        try:
+            while self.server.bytes_sent < 100 * 1024 * 1024:
+                self.wfile.write(chunk)
+                self.server.bytes_sent += len(chunk)
+        except ConnectionError:
+            pass
+        self.close_connection = True
+
+
+@pytest.fixture(scope="function")
+def endless_image_server():
+    yield from http_server_thread(EndlessImageHandler)
+
+
+class ConcurrentImageHandler(ImageHandler):
+    """Serve an image only once another request is being handled concurrently."""
+
+    barrier = threading.Barrier(2, timeout=5)
+
+    def do_GET(self):
+        try:
+            self.barrier.wait()
+        except threading.BrokenBarrierError:
+            self.send_error(http.HTTPStatus.REQUEST_TIMEOUT)
+            return
+        super().do_GET()
+
+
+@pytest.fixture(scope="function")
+def concurrent_image_server():
+    ConcurrentImageHandler.barrier.reset()
+    yield from http_server_thread(ConcurrentImageHandler, ThreadingCountingHTTPServer)
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark", action="store_true", help="run the benchmarks of test_benchmark"
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: benchmark, run with --benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="benchmark, run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
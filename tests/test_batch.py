@@ -0,0 +1,80 @@
+import io
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import docx
+import pytest
+
+from html2docx import html2docx
+from html2docx.batch import convert_many
+from html2docx.image import ImageFetcher
+
+from .test_html2docx import document_xml
+
+
+def test_convert_many_ordered():
+    jobs = [(f"<p>{i}</p>", f"title {i}") for i in range(6)]
+    results = list(convert_many(jobs, max_workers=2))
+    assert [result.position for result in results] == list(range(6))
+    for (html, title), result in zip(jobs, results):
+        assert result.error is None
+        assert result.title == title
+        doc = docx.Document(io.BytesIO(result.docx))
+        assert doc.core_properties.title == title
+        assert document_xml(io.BytesIO(result.docx)) == document_xml(
+            html2docx(html, title)
+        )
+
+
+def test_convert_many_unordered():
+    jobs = [(f"<p>{i}</p>", str(i)) for i in range(6)]
+    results = list(convert_many(jobs, max_workers=2, ordered=False))
+    assert sorted(result.position for result in results) == list(range(6))
+
+
+@pytest.mark.parametrize("max_workers", [0, 1])
+def test_convert_many_errors(max_workers, tmp_path):
+    html_path = tmp_path / "report.html"
+    html_path.write_text("<p>report</p>")
+    jobs = [html_path, tmp_path / "missing.html", ("<p>ok</p>", "ok")]
+    results = list(convert_many(jobs, max_workers=max_workers))
+    assert [result.title for result in results] == ["report", "missing", "ok"]
+    assert results[0].error is None
+    assert docx.Document(io.BytesIO(results[0].docx)).paragraphs[0].text == "report"
+    assert isinstance(results[1].error, FileNotFoundError)
+    assert results[1].docx is None
+    assert results[2].error is None
+
+
+class CrashingFetcher(ImageFetcher):
+    def fetch(self, src):
+        # Kill the worker process.
+        os._exit(1)
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_convert_many_worker_crash(ordered):
+    jobs = [(f"<p>{i}</p>", str(i)) for i in range(12)]
+    jobs[1] = ("<img src='http://crash.invalid/'>", "crash")
+    results = list(
+        convert_many(jobs, max_workers=2, ordered=ordered, fetcher=CrashingFetcher())
+    )
+    results.sort(key=lambda result: result.position)
+    assert [result.title for result in results] == [title for _, title in jobs]
+    assert isinstance(results[1].error, BrokenProcessPool)
+    # The jobs pending in the pools the crash broke are converted again.
+    for result in results[:1] + results[2:]:
+        assert result.error is None
+        assert docx.Document(io.BytesIO(result.docx)).paragraphs[0].text == result.title
+
+
+def test_convert_many_template(tmp_path):
+    template_doc = docx.Document()
+    template_doc.add_paragraph("Letterhead")
+    template_path = tmp_path / "template.docx"
+    template_doc.save(template_path)
+    (result,) = convert_many(
+        [("<p>body</p>", "t")], max_workers=1, template=str(template_path)
+    )
+    doc = docx.Document(io.BytesIO(result.docx))
+    assert [p.text for p in doc.paragraphs] == ["Letterhead", "body"]
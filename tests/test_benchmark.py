@@ -0,0 +1,157 @@
+"""Benchmarks of large and pathological documents.
+
+They are skipped unless pytest runs with --benchmark, e.g. tox -e benchmark. Each
+benchmark prints the latency percentiles, throughput and peak memory of a corpus,
+and asserts that doubling the corpus does not more than MAX_SCALING the time.
+"""
+import base64
+import gc
+import statistics
+import time
+import tracemalloc
+from typing import Callable, List, NamedTuple
+
+import pytest
+
+from html2docx import html2docx
+from html2docx.image import image_cache
+
+from .utils import generate_image
+
+pytestmark = pytest.mark.benchmark
+
+MAX_SCALING = 2.2
+REPEAT = 9
+
+
+class Measurement(NamedTuple):
+    size: int
+    latencies: List[float]
+    peak_memory: int
+
+    def percentile(self, percent: int) -> float:
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, len(latencies) * percent // 100)]
+
+    def report(self, name: str) -> str:
+        median = statistics.median(self.latencies)
+        return (
+            f"{name}: {self.size / 1024:.0f} KiB, "
+            f"p50 {median * 1000:.1f} ms, p95 {self.percentile(95) * 1000:.1f} ms, "
+            f"{self.size / median / 1024 / 1024:.2f} MiB/s, "
+            f"peak {self.peak_memory / 1024 / 1024:.1f} MiB"
+        )
+
+
+def time_conversion(html: str, **kwargs) -> float:
+    image_cache.clear()
+    gc.collect()
+    # Collections triggered by earlier rounds would be timed with this one.
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        html2docx(html, title="benchmark", **kwargs)
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def peak_memory(html: str, **kwargs) -> int:
+    image_cache.clear()
+    tracemalloc.start()
+    try:
+        html2docx(html, title="benchmark", **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def assert_scales_linearly(
+    name: str, corpus: Callable[[int], str], n: int, capsys, **kwargs
+) -> None:
+    small_html, large_html = corpus(n), corpus(2 * n)
+    small_latencies, large_latencies = [], []
+    # Both sizes are timed in alternation, so that a slower machine for a while
+    # slows both down instead of skewing the ratio.
+    for _ in range(REPEAT):
+        small_latencies.append(time_conversion(small_html, **kwargs))
+        large_latencies.append(time_conversion(large_html, **kwargs))
+    small = Measurement(
+        len(small_html.encode()), small_latencies, peak_memory(small_html, **kwargs)
+    )
+    large = Measurement(
+        len(large_html.encode()), large_latencies, peak_memory(large_html, **kwargs)
+    )
+    with capsys.disabled():
+        print()
+        print(small.report(f"{name} x{n}"))
+        print(large.report(f"{name} x{2 * n}"))
+    ratio = statistics.median(
+        large_time / small_time
+        for small_time, large_time in zip(small_latencies, large_latencies)
+    )
+    assert ratio <= MAX_SCALING, f"{name}: doubling the input took {ratio:.2f}x"
+
+
+def table(rows: int) -> str:
+    cells = "".join(f"<td>cell <b>{col}</b></td>" for col in range(5))
+    return "<table>" + f"<tr>{cells}</tr>" * rows + "</table>"
+
+
+def deep_list(items: int) -> str:
+    # Lists nested 10 levels deep, repeated.
+    depth = 10
+    nested = "<ul><li>item " * depth + "</li></ul>" * depth
+    return nested * (items // depth)
+
+
+def spans(count: int) -> str:
+    span = (
+        '<span style="text-decoration: underline">a <b>b <i>c</i></b></span> '
+        '<span style="text-decoration: line-through">d</span> '
+    )
+    return "<p>" + span * (count // 2) + "</p>"
+
+
+def nested_spans(depth: int) -> str:
+    return "<p>" + "<span><b>x</b>" * depth + "</span>" * depth + "</p>"
+
+
+def inline_images(count: int) -> str:
+    html = ""
+    for i in range(count):
+        data = base64.b64encode(generate_image(i % 50 + 1, 1).getvalue()).decode()
+        html += f'<p>{i}</p><img src="data:image/png;base64,{data}">'
+    return html
+
+
+def test_table(capsys):
+    assert_scales_linearly("table", table, 1000, capsys)
+
+
+def test_deep_list(capsys):
+    assert_scales_linearly("deep list", deep_list, 1000, capsys)
+
+
+def test_spans(capsys):
+    assert_scales_linearly("spans", spans, 4000, capsys)
+
+
+def test_nested_spans(capsys):
+    assert_scales_linearly("nested spans", nested_spans, 1000, capsys)
+
+
+def test_inline_images(capsys):
+    assert_scales_linearly("inline images", inline_images, 200, capsys)
+
+
+def test_remote_images(keep_alive_image_server, capsys):
+    def remote_images(count: int) -> str:
+        base_url = keep_alive_image_server.base_url
+        # Distinct URLs, so that each image is fetched.
+        return "".join(
+            f'<p>{i}</p><img src="{base_url}1x1.png?{count}-{i}">' for i in range(count)
+        )
+
+    assert_scales_linearly("remote images", remote_images, 200, capsys)
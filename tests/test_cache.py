@@ -0,0 +1,141 @@
+import os
+import time
+from unittest import mock
+
+from html2docx.cache import DiskCache, FailureCache, LRUCache, ResultCache
+
+
+def test_get_set():
+    cache = LRUCache(10)
+    assert cache.get("a") is None
+    cache.set("a", "A", 1)
+    assert cache.get("a") == "A"
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "evictions": 0,
+        "entries": 1,
+        "size": 1,
+    }
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(10)
+    cache.set("a", "A", 4)
+    cache.set("b", "B", 4)
+    cache.get("a")
+    cache.set("c", "C", 4)
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+    assert cache.evictions == 1
+    assert cache.size == 8
+
+
+def test_replace_updates_size():
+    cache = LRUCache(10)
+    cache.set("a", "A", 4)
+    cache.set("a", "AA", 6)
+    assert cache.size == 6
+    assert len(cache) == 1
+
+
+def test_value_larger_than_cache():
+    cache = LRUCache(10)
+    cache.set("a", "A", 11)
+    assert cache.get("a") is None
+    assert cache.size == 0
+
+
+def test_clear():
+    cache = LRUCache(10)
+    cache.set("a", "A", 4)
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_failure_cache_expires():
+    cache = FailureCache(ttl=10)
+    cache.add("a")
+    assert "a" in cache
+    assert "b" not in cache
+    with mock.patch(
+        "html2docx.cache.time.monotonic", return_value=time.monotonic() + 11
+    ):
+        assert "a" not in cache
+    assert len(cache) == 0
+
+
+def test_failure_cache_max_size():
+    cache = FailureCache(ttl=10, max_size=2)
+    for key in "abc":
+        cache.add(key)
+    assert "a" not in cache
+    assert "b" in cache and "c" in cache
+
+
+def test_failure_cache_disabled():
+    cache = FailureCache(ttl=0)
+    cache.add("a")
+    assert "a" not in cache
+
+
+def test_disk_get_set(tmp_path):
+    cache = DiskCache(tmp_path, 100)
+    assert cache.get("a") is None
+    cache.set("a", b"A", {"ETag": "1"})
+    entry = cache.get("a")
+    assert entry.data == b"A"
+    assert entry.metadata == {"ETag": "1"}
+    # Entries persist across instances.
+    assert DiskCache(tmp_path, 100).get("a") == entry
+
+
+def test_disk_evicts_least_recently_used(tmp_path):
+    # Each entry takes 30 bytes of data and about 30 bytes of metadata.
+    cache = DiskCache(tmp_path, 200)
+    for i, key in enumerate("abc"):
+        cache.set(key, b"x" * 30)
+        path = cache.path(key)
+        os.utime(path, (i, i))
+    cache.get("a")
+    cache.set("d", b"x" * 30)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.get("d") is not None
+    assert cache.size <= 200
+
+
+def test_disk_value_larger_than_cache(tmp_path):
+    cache = DiskCache(tmp_path, 10)
+    cache.set("a", b"x" * 11)
+    assert cache.get("a") is None
+    assert cache.size == 0
+
+
+def test_disk_clear(tmp_path):
+    cache = DiskCache(tmp_path, 100)
+    cache.set("a", b"A")
+    cache.clear()
+    assert cache.get("a") is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_result_cache_memory():
+    cache = ResultCache(memory_size=10)
+    assert cache.get("a") is None
+    cache.set("a", b"docx")
+    assert cache.get("a") == b"docx"
+    cache.set("b", b"too large docx")
+    assert cache.get("b") is None
+
+
+def test_result_cache_disk(tmp_path):
+    ResultCache(directory=tmp_path).set("a", b"docx")
+    cache = ResultCache(directory=tmp_path)
+    assert cache.get("a") == b"docx"
+    assert cache.memory.get("a") == b"docx"
+    cache.clear()
+    assert cache.get("a") is None
@@ -1,15 +1,35 @@
+import functools
+import io
 import json
+import shutil
+import time
+import zipfile
 from typing import Union
+from unittest import mock
 
 import docx
 import pytest
 from docx.document import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml import CT_P, CT_Tbl
 from docx.shared import Pt
 from docx.table import Table, _Cell
 from docx.text.paragraph import Paragraph
 
-from html2docx import html2docx
+from html2docx import (
+    convert,
+    feed_chunks,
+    html2docx,
+    html2docx_save,
+    html2docx_stream,
+    library_version,
+    result_key,
+)
+from html2docx.cache import ResultCache
+from html2docx.html2docx import HTML2Docx, parse_style, run_properties
+from html2docx.image import HTTPImageFetcher, ImageFetcher, ImageLoader, image_cache
+from html2docx.instrumentation import Instrumentation
+from html2docx.template import DocumentTemplate
 
 from .utils import PROJECT_DIR, TEST_DIR
 
@@ -110,7 +130,8 @@ def assert_element_comply_with_spec(
 
 
 @pytest.mark.parametrize("html_path,spec_path", generate_testdata())
-def test_html2docx(html_path, spec_path):
+@pytest.mark.parametrize("direct_xml", [False, True])
+def test_html2docx(html_path, spec_path, direct_xml):
     html_rel_path = html_path.relative_to(PROJECT_DIR)
     spec_rel_path = spec_path.relative_to(PROJECT_DIR)
 
@@ -119,8 +140,316 @@ def test_html2docx(html_path, spec_path):
     with spec_path.open() as fp:
         spec = json.load(fp)
 
-    buf = html2docx(html, title=title)
+    buf = html2docx(html, title=title, direct_xml=direct_xml)
     doc = docx.Document(buf)
 
     assert doc.core_properties.title == title
     assert_element_comply_with_spec(doc, spec, html_rel_path, spec_rel_path)
+
+
+def test_images_keep_document_order(image_server):
+    html = "".join(
+        f'<p>{i}</p><img src="{image_server.base_url}{name}">'
+        for i, name in enumerate(["1x1.png", "missing.png", "1x1.png"])
+    )
+    buf = html2docx(html, title="images", max_workers=2)
+    doc = docx.Document(buf)
+    texts = [p.text for p in doc.paragraphs]
+    assert texts == ["0", "", "1", "", "2", ""]
+    shapes = doc.inline_shapes
+    assert len(shapes) == 3
+    # The second image is the broken image placeholder.
+    assert shapes[0].width == shapes[2].width != shapes[1].width
+    assert image_server.httpd.request_count == 2
+
+
+def test_large_table():
+    rows = 300
+    html = "<table>"
+    for row in range(rows):
+        cols = 3 if row % 2 else 2
+        html += "<tr>" + "".join(f"<td>{row}.{col}</td>" for col in range(cols))
+    html += "</table>"
+    doc = docx.Document(html2docx(html, title="table"))
+    (table,) = doc.tables
+    assert len(table.rows) == rows
+    assert len(table.columns) == 3
+    widths = {col.width for col in table.columns}
+    assert len(widths) == 1
+    assert table.cell(rows - 1, 2).text == f"{rows - 1}.2"
+    assert table.cell(rows - 2, 2).text == ""
+
+
+class NoImageFetcher(ImageFetcher):
+    def fetch(self, src):
+        return None
+
+
+def document_xml(buf):
+    with zipfile.ZipFile(buf) as docx_zip:
+        return docx_zip.read("word/document.xml")
+
+
+@pytest.mark.parametrize("html_path,spec_path", generate_testdata())
+@pytest.mark.parametrize("chunk_size", [1, 7])
+def test_html2docx_stream(html_path, spec_path, chunk_size):
+    html = html_path.read_text()
+    expected = document_xml(html2docx(html, title="stream", fetcher=NoImageFetcher()))
+    data = f"\ufeff \n{html}\n ".encode()
+    chunks = iter(functools.partial(io.BytesIO(data).read, chunk_size), b"")
+    buf = html2docx_stream(chunks, title="stream", fetcher=NoImageFetcher())
+    assert document_xml(buf) == expected
+
+
+@pytest.mark.parametrize("html_path,spec_path", generate_testdata())
+def test_direct_xml(html_path, spec_path):
+    html = html_path.read_text()
+    expected = document_xml(html2docx(html, title="xml", fetcher=NoImageFetcher()))
+    buf = html2docx(html, title="xml", fetcher=NoImageFetcher(), direct_xml=True)
+    assert document_xml(buf) == expected
+
+
+def test_html2docx_stream_file(tmp_path):
+    html_path = TEST_DIR / "data" / "a.html"
+    expected = document_xml(html2docx(html_path.read_text(), title="a"))
+    with html_path.open("rb") as fp:
+        assert document_xml(html2docx_stream(fp, title="a")) == expected
+    with html_path.open() as fp:
+        assert document_xml(html2docx_stream(fp, title="a")) == expected
+
+
+def test_html2docx_stream_text_nodes():
+    fed = []
+    parser = mock.Mock(feed=fed.append)
+    chunks = [" \n<p>", "a" * 10, "b" * 10, "</p>", "\n "]
+    feed_chunks(parser, chunks)
+    # Text nodes are fed whole, once the next "<" is seen.
+    assert fed == ["<", "p>" + "a" * 10 + "b" * 10 + "<", "/p>"]
+
+
+class SocketLikeStream:
+    """A write-only, non-seekable stream."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+@pytest.mark.parametrize("kind", ["path", "str", "seekable", "non-seekable"])
+def test_html2docx_save(kind, tmp_path):
+    html = "<p>Hello <b>world</b></p>"
+    expected = document_xml(html2docx(html, title="save"))
+    path = tmp_path / "out.docx"
+    if kind == "path":
+        html2docx_save(html, "save", path)
+        buf = io.BytesIO(path.read_bytes())
+    elif kind == "str":
+        html2docx_save(html, "save", str(path))
+        buf = io.BytesIO(path.read_bytes())
+    elif kind == "seekable":
+        buf = io.BytesIO()
+        html2docx_save(html, "save", buf)
+    else:
+        stream = SocketLikeStream()
+        html2docx_save(html, "save", stream)
+        buf = io.BytesIO(stream.data)
+    assert document_xml(buf) == expected
+
+
+def test_html2docx_save_stream_source(tmp_path):
+    html = b"<p>Hello <b>world</b></p>"
+    expected = document_xml(html2docx(html.decode(), title="save"))
+    path = tmp_path / "out.docx"
+    html2docx_save(io.BytesIO(html), "save", path)
+    assert document_xml(io.BytesIO(path.read_bytes())) == expected
+
+
+def test_style_parsing_is_cached():
+    parse_style.cache_clear()
+    html = '<p style="text-align: center">' + (
+        '<span style="text-decoration: underline">u</span>' * 10
+    )
+    html += "</p>"
+    doc = docx.Document(html2docx(html, title="style"))
+    (p,) = doc.paragraphs
+    assert p.alignment == WD_ALIGN_PARAGRAPH.CENTER
+    assert all(run.font.underline for run in p.runs)
+    info = parse_style.cache_info()
+    assert info.misses == 2
+    assert info.hits == 9
+
+
+def test_run_properties_are_copied():
+    run_properties.cache_clear()
+    html = "<p><b>a<i>b</i></b> <b>c<i>d</i></b></p>"
+    doc = docx.Document(html2docx(html, title="runs"))
+    runs = doc.paragraphs[0].runs
+    assert [(r.text, r.font.bold, r.font.italic) for r in runs] == [
+        ("a", True, None),
+        ("b", True, True),
+        (" ", None, None),
+        ("c", True, None),
+        ("d", True, True),
+    ]
+    info = run_properties.cache_info()
+    assert info.misses == 3
+    assert info.hits == 2
+
+
+@pytest.mark.parametrize(
+    "merge_runs,runs,merged", [(True, ["ab\nc"], 1), (False, ["a", "b\nc"], 0)]
+)
+def test_merge_runs(merge_runs, runs, merged):
+    html = "<p><b>a</b><b>b<br>c</b></p>"
+    parser = convert(html, "merge", merge_runs=merge_runs)
+    assert [run.text for run in parser.doc.paragraphs[0].runs] == runs
+    assert parser.merged_runs == merged
+
+
+class StrikeHTML2Docx(HTML2Docx):
+    run_fonts = {**HTML2Docx.run_fonts, "s": [("strike", True)]}
+    start_tags = {**HTML2Docx.start_tags, "hr": "start_hr"}
+
+    def start_hr(self, tag, attrs):
+        self.finish_p()
+        self.add_paragraph().add_run("---")
+
+
+def test_register_tags():
+    parser = StrikeHTML2Docx("tags")
+    parser.feed("<p>a <s>b</s></p><hr><p>c</p>")
+    parser.close()
+    paragraphs = parser.doc.paragraphs
+    assert [p.text for p in paragraphs] == ["a b", "---", "c"]
+    assert [r.font.strike for r in paragraphs[0].runs] == [None, True]
+
+
+def test_output_is_deterministic():
+    html = "<h1>Title</h1><p>Hello <b>world</b></p>"
+    first = html2docx(html, title="same").getvalue()
+    # zip timestamps have a 2 s resolution.
+    with mock.patch("time.time", return_value=time.time() + 2):
+        assert html2docx(html, title="same").getvalue() == first
+
+
+def test_result_cache(image_server):
+    cache = ResultCache()
+    html = f'<p>cached</p><img src="{image_server.base_url}1x1.png">'
+    first = html2docx(html, title="cache", result_cache=cache)
+    assert len(cache.memory) == 1
+    assert image_server.httpd.request_count == 1
+    image_cache.clear()
+    second = html2docx(html, title="cache", result_cache=cache, max_workers=1)
+    assert second.getvalue() == first.getvalue()
+    assert image_server.httpd.request_count == 1
+    html2docx(html, title="other title", result_cache=cache)
+    assert len(cache.memory) == 2
+
+
+def test_image_budget_per_document(image_server):
+    html = f'<img src="{image_server.base_url}1x1.png?budget">'
+    parsers = [
+        HTML2Docx("over budget", max_image_bytes=10),
+        HTML2Docx("unlimited"),
+    ]
+    for parser in parsers:
+        parser.feed(html)
+        parser.close()
+    # The image that did not fit in the budget of the first document is not
+    # remembered as a failure by the shared fetcher.
+    assert [parser.broken_images for parser in parsers] == [1, 0]
+    assert image_server.httpd.request_count == 2
+
+
+def test_result_cache_skips_broken_images(image_server):
+    cache = ResultCache()
+    html = f'<img src="{image_server.base_url}missing.png">'
+    html2docx(html, title="broken", result_cache=cache)
+    assert len(cache.memory) == 0
+
+
+def test_result_cache_custom_fetcher():
+    cache = ResultCache()
+    html2docx("<p>a</p>", title="fetcher", result_cache=cache, fetcher=NoImageFetcher())
+    assert len(cache.memory) == 0
+    template = DocumentTemplate()
+    html2docx("<p>a</p>", title="template", result_cache=cache, template=template)
+    assert len(cache.memory) == 1
+
+
+def test_result_cache_http_fetcher():
+    class RewritingFetcher(HTTPImageFetcher):
+        def fetch(self, src):
+            return None
+
+    cache = ResultCache()
+    html = "<p>http</p>"
+    html2docx(html, title="rewriting", result_cache=cache, fetcher=RewritingFetcher())
+    assert len(cache.memory) == 0
+    html2docx(html, title="http", result_cache=cache, fetcher=HTTPImageFetcher())
+    assert len(cache.memory) == 1
+    # The default fetcher retrieves the same images as any HTTPImageFetcher.
+    html2docx(html, title="http", result_cache=cache)
+    assert len(cache.memory) == 1
+
+
+def test_result_key_tracks_source(tmp_path):
+    package_dir = tmp_path / "html2docx"
+    shutil.copytree(PROJECT_DIR / "html2docx", package_dir)
+    keys = []
+    for code in ["", "# changed\n"]:
+        with (package_dir / "html2docx.py").open("a") as fp:
+            fp.write(code)
+        library_version.cache_clear()
+        with mock.patch("html2docx.PACKAGE_DIR", package_dir):
+            keys.append(result_key("<p>a</p>", "key", {}))
+    library_version.cache_clear()
+    assert keys[0] != keys[1]
+
+
+def test_instrumentation(image_server):
+    instrumentation = Instrumentation()
+    html = (
+        '<p style="text-align: center">a <b>b</b></p>'
+        "<table><tr><td>c</td></tr></table>"
+        f'<img src="{image_server.base_url}1x1.png">'
+        f'<img src="{image_server.base_url}1x1.png">'
+    )
+    html2docx(html, title="instrumented", instrumentation=instrumentation)
+    assert set(instrumentation.phases) == {
+        "parse",
+        "css",
+        "table",
+        "image_fetch",
+        "image_parse",
+        "pictures",
+        "save",
+    }
+    counters = instrumentation.counters
+    assert counters["tag.p"] == 1
+    assert counters["tag.img"] == 2
+    assert counters["images"] == 2
+    assert counters["images_fetched"] == 1
+    assert counters["image_bytes"] > 0
+    assert counters["runs"] >= 2
+
+    cache = ResultCache()
+    html2docx(html, title="cached", result_cache=cache)
+    html2docx(html, title="cached", result_cache=cache, instrumentation=instrumentation)
+    assert instrumentation.counters["result_cache_hits"] == 1
+
+
+def test_instrumentation_image_loader():
+    loader = ImageLoader(max_workers=0, fetcher=NoImageFetcher())
+    instrumentation = Instrumentation()
+    html2docx(
+        "<p>a</p>",
+        title="loader",
+        image_loader=loader,
+        instrumentation=instrumentation,
+    )
+    assert loader.instrumentation is None
+    assert instrumentation.counters["tag.p"] == 1
@@ -1,9 +1,23 @@
 import base64
-import urllib.error
-import urllib.request
+import http.client
+import socket
+import threading
+import time
 from unittest import mock
 
-from html2docx.image import load_image
+import pytest
+
+from html2docx.cache import DiskCache
+from html2docx.image import (
+    READ_CHUNK_SIZE,
+    HTTPImageFetcher,
+    ImageFetcher,
+    ImageLoader,
+    image_cache,
+    load_image,
+    load_inline_image,
+    set_broken_image,
+)
 
 from .utils import PROJECT_DIR, TEST_DIR, generate_image
 
@@ -14,92 +28,405 @@ broken_image_bytes = broken_image.read_bytes()
 def test_basic(image_server):
     image_data = load_image(image_server.base_url + "1x1.png")
     expected = TEST_DIR / "data" / "1x1.png"
-    assert image_data.getbuffer() == expected.read_bytes()
+    assert image_data.data == expected.read_bytes()
 
 
 def test_non_image(image_server):
     image_data = load_image(image_server.base_url)
-    assert image_data.getbuffer() == broken_image_bytes
+    assert image_data.data == broken_image_bytes
 
 
 def test_bad_url():
     image_data = load_image("bad")
-    assert image_data.getbuffer() == broken_image_bytes
+    assert image_data.data == broken_image_bytes
 
 
 def test_transient_network_error_retries():
     url = "https://transient.network.issue.com/image.png"
     with mock.patch(
-        "html2docx.image.urllib.request.urlopen",
+        "html2docx.image.http.client.HTTPSConnection.connect",
         autospec=True,
-        side_effect=urllib.error.URLError(
-            reason="[Errno -2] Name or service not known"
-        ),
-    ) as url_mock:
+        side_effect=socket.gaierror(-2, "Name or service not known"),
+    ) as connect_mock:
         with mock.patch("html2docx.image.time.sleep", autospec=True) as time_mock:
             image_data = load_image(url)
             assert time_mock.mock_calls == [mock.call(1)] * 2
-        assert url_mock.call_args_list == [mock.call(url)] * 3
-    assert image_data.getbuffer() == broken_image_bytes
+        assert connect_mock.call_count == 3
+    assert image_data.data == broken_image_bytes
 
 
 def test_404(image_server):
     image_data = load_image(image_server.base_url + "nonexistent")
-    assert image_data.getbuffer() == broken_image_bytes
+    assert image_data.data == broken_image_bytes
     assert image_server.httpd.request_count == 1
 
 
 def test_bad_server(bad_server):
     image_data = load_image(bad_server.base_url)
-    assert image_data.getbuffer() == broken_image_bytes
+    assert image_data.data == broken_image_bytes
     assert bad_server.httpd.request_count == 1
 
 
 def test_bad_content_length(bad_content_length_server):
     image_data = load_image(bad_content_length_server.base_url)
-    assert image_data.getbuffer() == broken_image_bytes
+    assert image_data.data == broken_image_bytes
     assert bad_content_length_server.httpd.request_count == 1
 
 
+def test_non_image_rejected_early(image_server):
+    with mock.patch("html2docx.image.SNIFF_SIZE", 8):
+        with mock.patch(
+            "html2docx.image.http.client.HTTPResponse.read",
+            autospec=True,
+            side_effect=http.client.HTTPResponse.read,
+        ) as read_mock:
+            assert HTTPImageFetcher().fetch(image_server.base_url) is None
+    assert [c.args[1:] for c in read_mock.mock_calls] == [(8,)]
+
+
+def test_oversized_image_aborted(endless_image_server):
+    fetcher = HTTPImageFetcher()
+    assert fetcher.fetch(endless_image_server.base_url + "endless.png") is None
+    # The connection is closed once the size limit is exceeded.
+    endless_image_server.terminate()
+    assert endless_image_server.httpd.bytes_sent < 100 * 1024 * 1024
+
+
 def test_inline_base64():
     image = generate_image(width=1, height=1)
     image_b64 = base64.b64encode(image.getbuffer()).decode()
     src = f"data:image/png;base64,{image_b64}"
     image_data = load_image(src)
-    assert image_data.getbuffer() == image.getbuffer()
+    assert image_data.data == image.getbuffer()
 
 
 def test_inline_non_ascii():
     src = "data:image/png;base64,🦝"
     image_data = load_image(src)
-    assert image_data.getbuffer() == broken_image_bytes
+    assert image_data.data == broken_image_bytes
 
 
 def test_inline_non_base64():
     src = "data:image/png;base64,https://example.org/"
     image_data = load_image(src)
-    assert image_data.getbuffer() == broken_image_bytes
+    assert image_data.data == broken_image_bytes
 
 
 def test_inline_unknown_encoding():
     src = "data:image/png;unknown,foobar"
     image_data = load_image(src)
-    assert image_data.getbuffer() == broken_image_bytes
+    assert image_data.data == broken_image_bytes
 
 
 def test_inline_base64_marker_in_data():
     src = "data:text/plain,this is not ;base64, encoded."
     image_data = load_image(src)
-    assert image_data.getbuffer() == broken_image_bytes
+    assert image_data.data == broken_image_bytes
 
 
 def test_inline_missing_comma():
     src = "data:image/png;base64https://example.org/"
     image_data = load_image(src)
-    assert image_data.getbuffer() == broken_image_bytes
+    assert image_data.data == broken_image_bytes
+
+
+@mock.patch("html2docx.image.INLINE_CHUNK_SIZE", 8)
+def test_inline_base64_chunks():
+    image = generate_image(width=10, height=10)
+    image_b64 = base64.b64encode(image.getbuffer()).decode()
+    image_data = load_image(f"data:image/png;base64,{image_b64}")
+    assert image_data.data == image.getbuffer()
+    assert load_image(f"data:image/png;base64,{image_b64}A").data == broken_image_bytes
+
+
+def test_inline_too_large():
+    image = generate_image(width=10, height=10)
+    image_b64 = base64.b64encode(image.getbuffer()).decode()
+    image_cache.clear()
+    with mock.patch("html2docx.image.MAX_IMAGE_SIZE", len(image.getbuffer()) - 1):
+        image_data = load_image(f"data:image/png;base64,{image_b64}")
+    assert image_data.data == broken_image_bytes
+
+
+def test_loader_dedupes_inline_images():
+    image = generate_image(width=1, height=1)
+    image_b64 = base64.b64encode(image.getbuffer()).decode()
+    # Distinct strings, as parsed from distinct attributes.
+    sources = [f"data:image/png;base64,{image_b64}" for _ in range(2)]
+    image_cache.clear()
+    loader = ImageLoader()
+    with mock.patch(
+        "html2docx.image.load_inline_image", wraps=load_inline_image
+    ) as load_mock:
+        keys = [loader.submit(src) for src in sources]
+    assert load_mock.call_count == 1
+    assert keys[0] == keys[1]
+    assert len(keys[0]) < len(sources[0])
+    assert loader.result(keys[0]).data == image.getvalue()
 
 
 def test_unknown_scheme():
     src = ""
     image_data = load_image(src)
-    assert image_data.getbuffer() == broken_image_bytes
+    assert image_data.data == broken_image_bytes
+
+
+def test_loader_fetches_concurrently(concurrent_image_server):
+    # The server only answers when two requests are in flight at the same time.
+    loader = ImageLoader(max_workers=2)
+    srcs = [concurrent_image_server.base_url + f"1x1.png?{i}" for i in range(2)]
+    for src in srcs:
+        loader.submit(src)
+    expected = (TEST_DIR / "data" / "1x1.png").read_bytes()
+    for src in srcs:
+        assert loader.result(src).data == expected
+    loader.shutdown()
+
+
+def test_loader_dedupes_src(image_server):
+    loader = ImageLoader()
+    src = image_server.base_url + "1x1.png"
+    loader.submit(src)
+    loader.submit(src)
+    assert loader.result(src).data == loader.result(src).data
+    loader.shutdown()
+    assert image_server.httpd.request_count == 1
+
+
+def test_loader_synchronous(image_server):
+    loader = ImageLoader(max_workers=0)
+    loader.submit(image_server.base_url + "1x1.png")
+    assert image_server.httpd.request_count == 1
+    assert loader.executor is None
+
+
+def test_keep_alive(keep_alive_image_server):
+    fetcher = HTTPImageFetcher()
+    expected = (TEST_DIR / "data" / "1x1.png").read_bytes()
+    for _ in range(3):
+        assert fetcher.fetch(keep_alive_image_server.base_url + "1x1.png") == expected
+    fetcher.close()
+    assert keep_alive_image_server.httpd.request_count == 1
+
+
+def test_keep_alive_reconnects(keep_alive_image_server):
+    fetcher = HTTPImageFetcher()
+    src = keep_alive_image_server.base_url + "1x1.png"
+    assert fetcher.fetch(src)
+    # Simulate the server dropping the idle connection.
+    for connections in fetcher.idle.values():
+        for conn in connections:
+            assert conn.sock is not None
+            conn.sock.shutdown(socket.SHUT_RDWR)
+    assert fetcher.fetch(src)
+    fetcher.close()
+    assert keep_alive_image_server.httpd.request_count == 2
+
+
+def test_redirect(redirect_server):
+    image_data = load_image(redirect_server.base_url + "1x1.png")
+    expected = TEST_DIR / "data" / "1x1.png"
+    assert image_data.data == expected.read_bytes()
+
+
+def test_proxy(proxy_server, monkeypatch):
+    proxy = proxy_server.base_url.replace("http://", "http://user:p%40ss@")
+    monkeypatch.setenv("http_proxy", proxy)
+    monkeypatch.delenv("no_proxy", raising=False)
+    fetcher = HTTPImageFetcher()
+    data = fetcher.fetch("http://images.invalid/1x1.png?v=1")
+    assert data == (TEST_DIR / "data" / "1x1.png").read_bytes()
+    assert proxy_server.httpd.paths == ["http://images.invalid/1x1.png?v=1"]
+    assert proxy_server.httpd.proxy_authorization == "Basic dXNlcjpwQHNz"
+
+
+def test_no_proxy(image_server, monkeypatch):
+    monkeypatch.setenv("http_proxy", "http://proxy.invalid:3128")
+    monkeypatch.setenv("no_proxy", "localhost")
+    assert HTTPImageFetcher().fetch(image_server.base_url + "1x1.png")
+    assert image_server.httpd.request_count == 1
+
+
+def test_custom_fetcher():
+    image = generate_image(width=1, height=1)
+
+    class MemoryFetcher(ImageFetcher):
+        def fetch(self, src):
+            return image.getvalue() if src == "memory://logo" else None
+
+    fetcher = MemoryFetcher()
+    assert load_image("memory://logo", fetcher).data == image.getvalue()
+    assert load_image("memory://other", fetcher).data == broken_image_bytes
+
+
+def test_custom_fetchers_cached_separately():
+    class TenantFetcher(ImageFetcher):
+        def __init__(self, size):
+            self.image = generate_image(width=size, height=size).getvalue()
+            self.requests = 0
+
+        def fetch(self, src):
+            self.requests += 1
+            return self.image
+
+    src = "https://tenant.example/logo.png"
+    small, large = TenantFetcher(2), TenantFetcher(5)
+    assert load_image(src, small).data == small.image
+    assert load_image(src, large).data == large.image
+    assert load_image(src, small).data == small.image
+    assert (small.requests, large.requests) == (1, 1)
+    assert image_cache.get(src) is None
+
+
+def test_http_fetcher_subclass_cached_separately():
+    image = generate_image(width=3, height=3).getvalue()
+
+    class RewritingFetcher(HTTPImageFetcher):
+        def fetch(self, src):
+            return image
+
+    src = "https://tenant.example/rewritten.png"
+    assert load_image(src, RewritingFetcher()).data == image
+    assert image_cache.get(src) is None
+
+
+def test_cache_hit(image_server):
+    src = image_server.base_url + "1x1.png"
+    first = load_image(src)
+    hits = image_cache.hits
+    with mock.patch("html2docx.image.Image.from_blob", autospec=True) as parse_mock:
+        second = load_image(src)
+        assert not parse_mock.called
+    assert image_cache.hits == hits + 1
+    assert first == second
+    assert image_server.httpd.request_count == 1
+
+
+def test_cache_skips_broken_image(image_server):
+    src = image_server.base_url + "nonexistent"
+    fetcher = HTTPImageFetcher(failure_ttl=0)
+    load_image(src, fetcher)
+    load_image(src, fetcher)
+    assert image_server.httpd.request_count == 2
+
+
+def test_failure_cache(image_server):
+    src = image_server.base_url + "nonexistent"
+    fetcher = HTTPImageFetcher(failure_ttl=60)
+    assert load_image(src, fetcher).broken
+    assert load_image(src, fetcher).broken
+    assert image_server.httpd.request_count == 1
+    with mock.patch(
+        "html2docx.cache.time.monotonic", return_value=time.monotonic() + 61
+    ):
+        load_image(src, fetcher)
+    assert image_server.httpd.request_count == 2
+
+
+def test_broken_image_parsed_once():
+    load_image("bad")
+    with mock.patch("html2docx.image.Image.from_blob", autospec=True) as parse_mock:
+        image_data = load_image("bad")
+        assert not parse_mock.called
+    assert image_data.broken
+    assert image_data.data == broken_image_bytes
+
+
+def test_custom_broken_image():
+    placeholder = generate_image(width=2, height=2).getvalue()
+    set_broken_image(placeholder)
+    try:
+        image_data = load_image("bad")
+    finally:
+        set_broken_image(None)
+    assert image_data.broken
+    assert image_data.data == placeholder
+    assert load_image("bad").data == broken_image_bytes
+    with pytest.raises(ValueError):
+        set_broken_image(b"not an image")
+
+
+def test_disk_cache_etag(etag_image_server, tmp_path):
+    src = etag_image_server.base_url + "1x1.png"
+    expected = (TEST_DIR / "data" / "1x1.png").read_bytes()
+    disk_cache = DiskCache(tmp_path, 1024 * 1024)
+    assert HTTPImageFetcher(disk_cache=disk_cache).fetch(src) == expected
+    assert disk_cache.get(src).metadata == {"ETag": '"1x1"'}
+    # A new fetcher, e.g. in another process, revalidates the stored image.
+    with mock.patch.object(disk_cache, "set", autospec=True) as set_mock:
+        assert HTTPImageFetcher(disk_cache=disk_cache).fetch(src) == expected
+        assert not set_mock.called
+
+
+def test_disk_cache_last_modified(image_server, tmp_path):
+    src = image_server.base_url + "1x1.png"
+    expected = (TEST_DIR / "data" / "1x1.png").read_bytes()
+    disk_cache = DiskCache(tmp_path, 1024 * 1024)
+    assert HTTPImageFetcher(disk_cache=disk_cache).fetch(src) == expected
+    assert "Last-Modified" in disk_cache.get(src).metadata
+    with mock.patch.object(disk_cache, "set", autospec=True) as set_mock:
+        assert HTTPImageFetcher(disk_cache=disk_cache).fetch(src) == expected
+        assert not set_mock.called
+
+
+def test_disk_cache_changed_image(etag_image_server, tmp_path):
+    src = etag_image_server.base_url + "1x1.png"
+    disk_cache = DiskCache(tmp_path, 1024 * 1024)
+    disk_cache.set(src, b"stale", {"ETag": '"old"'})
+    expected = (TEST_DIR / "data" / "1x1.png").read_bytes()
+    assert HTTPImageFetcher(disk_cache=disk_cache).fetch(src) == expected
+    assert disk_cache.get(src).data == expected
+
+
+def test_loader_byte_budget():
+    image = generate_image(width=1, height=1).getvalue()
+
+    fetched = []
+
+    class MemoryFetcher(ImageFetcher):
+        def fetch(self, src):
+            fetched.append(src)
+            return image
+
+    loader = ImageLoader(max_workers=0, fetcher=MemoryFetcher(), max_bytes=len(image))
+    assert loader.result("memory://budget-1").data == image
+    assert loader.result("memory://budget-2").data == broken_image_bytes
+    # Once the budget is spent, images are no longer fetched.
+    assert fetched == ["memory://budget-1"]
+
+
+def test_loader_byte_budget_while_downloading(endless_image_server):
+    max_bytes = 256 * 1024
+    loader = ImageLoader(max_workers=0, fetcher=HTTPImageFetcher(), max_bytes=max_bytes)
+    image_data = loader.result(endless_image_server.base_url + "endless.png")
+    assert image_data.data == broken_image_bytes
+    # The download is abandoned once over budget, not at MAX_IMAGE_SIZE.
+    assert max_bytes < loader.bytes_loaded <= max_bytes + READ_CHUNK_SIZE
+
+
+def test_loader_deadline():
+    release = threading.Event()
+
+    class StalledFetcher(ImageFetcher):
+        def fetch(self, src):
+            release.wait(5)
+            return None
+
+    loader = ImageLoader(fetcher=StalledFetcher(), deadline=0.1)
+    loader.submit("memory://stalled")
+    start = time.monotonic()
+    assert loader.result("memory://stalled").data == broken_image_bytes
+    assert time.monotonic() - start < 1
+    release.set()
+    loader.shutdown()
+
+
+def test_fetcher_timeout():
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        port = server.getsockname()[1]
+        fetcher = HTTPImageFetcher(timeout=0.1)
+        start = time.monotonic()
+        assert fetcher.fetch(f"http://127.0.0.1:{port}/1x1.png") is None
+        assert time.monotonic() - start < 1
@@ -0,0 +1,107 @@
+from unittest import mock
+
+import docx
+import pytest
+
+from html2docx import html2docx
+from html2docx.instrumentation import Instrumentation
+from html2docx.parallel import html2docx_parallel, split_html
+
+from .test_html2docx import NoImageFetcher, generate_testdata
+
+NESTED = (
+    "<p>a<b>b<i>c<sub>d</sub></i></b><code>e</code></p><h2>f</h2>"
+    "<ul><li>g<ul><li>h<img src='x'>i</li></ul></li></ul>"
+    "<table><tr><td>j</td></tr><tr><td>k</td><td>l</td></tr></table>"
+)
+
+
+@pytest.mark.parametrize("html_path,spec_path", generate_testdata())
+def test_html2docx_parallel(html_path, spec_path):
+    html = html_path.read_text() * 2
+    expected = html2docx(html, title="parallel", fetcher=NoImageFetcher())
+    buf = html2docx_parallel(
+        html, title="parallel", max_workers=2, chunk_size=1, fetcher=NoImageFetcher()
+    )
+    assert buf.getvalue() == expected.getvalue()
+
+
+@pytest.mark.parametrize("direct_xml", [False, True])
+def test_html2docx_parallel_tables(direct_xml):
+    html = NESTED * 3
+    assert len(split_html(html, 1)) == 10
+    expected = html2docx(
+        html, title="parallel", fetcher=NoImageFetcher(), direct_xml=direct_xml
+    )
+    buf = html2docx_parallel(
+        html,
+        title="parallel",
+        max_workers=2,
+        chunk_size=1,
+        fetcher=NoImageFetcher(),
+        direct_xml=direct_xml,
+    )
+    assert buf.getvalue() == expected.getvalue()
+
+
+@pytest.mark.parametrize("max_workers", [0, 1])
+def test_html2docx_parallel_serial(max_workers):
+    html = NESTED * 3
+    expected = html2docx(html, title="serial", fetcher=NoImageFetcher())
+    with mock.patch("concurrent.futures.ProcessPoolExecutor") as executor_mock:
+        buf = html2docx_parallel(
+            html,
+            title="serial",
+            max_workers=max_workers,
+            chunk_size=1,
+            fetcher=NoImageFetcher(),
+        )
+    assert not executor_mock.called
+    assert buf.getvalue() == expected.getvalue()
+
+
+def test_html2docx_parallel_images(image_server):
+    html = "".join(
+        f'<p>{i}</p><p><img src="{image_server.base_url}{name}"></p>'
+        for i, name in enumerate(["1x1.png", "missing.png", "1x1.png"])
+    )
+    expected = html2docx(html, title="images")
+    buf = html2docx_parallel(html, title="images", max_workers=2, chunk_size=1)
+    assert buf.getvalue() == expected.getvalue()
+    assert len(docx.Document(buf).inline_shapes) == 3
+
+
+def test_html2docx_parallel_instrumentation():
+    html = NESTED * 3
+    expected = Instrumentation()
+    html2docx(html, title="serial", fetcher=NoImageFetcher(), instrumentation=expected)
+    instrumentation = Instrumentation()
+    html2docx_parallel(
+        html,
+        title="parallel",
+        max_workers=2,
+        chunk_size=1,
+        fetcher=NoImageFetcher(),
+        instrumentation=instrumentation,
+    )
+    assert instrumentation.counters == expected.counters
+    assert set(instrumentation.phases) == set(expected.phases) | {"merge"}
+
+
+@pytest.mark.parametrize(
+    "html,chunks",
+    [
+        ("<p>a</p><p>b</p><h1>c</h1>", ["<p>a</p>", "<p>b</p>", "<h1>c</h1>"]),
+        ("<p>a</p>\n<ul><li>b</li></ul>", ["<p>a</p>\n", "<ul><li>b</li></ul>"]),
+        # Split after elements that reset the parser only.
+        ("<table><tr><td>a</td></tr></table><p>b</p>", None),
+        ("<p>a</p>b<p>c</p>", None),
+        ("<p>a</p><a href='x'></a><p>b</p>", None),
+        # Split between top-level elements only.
+        ("<span><p>a</p><p>b</p></span>", None),
+        ("<ul><li><p>a</p><p>b</p></li></ul>", None),
+    ],
+)
+def test_split_html(html, chunks):
+    assert split_html(html, 1) == (chunks or [html])
+    assert split_html(html, len(html)) == [html]
@@ -0,0 +1,90 @@
+import base64
+import io
+import os
+
+import docx
+from docx.image.image import Image as DocxImage
+from PIL import Image
+
+from html2docx import convert, html2docx
+from html2docx.image import image_cache
+from html2docx.resample import ImageResampler
+
+from .utils import generate_image
+
+
+def photo(width: int, height: int, format: str = "png") -> bytes:
+    data = io.BytesIO()
+    with Image.frombytes("RGB", (width, height), os.urandom(width * height * 3)) as img:
+        img.save(data, format=format)
+    return data.getvalue()
+
+
+def img_tag(data: bytes, mime: str = "image/png", attrs: str = "") -> str:
+    return f'<img src="data:{mime};base64,{base64.b64encode(data).decode()}"{attrs}>'
+
+
+def pictures(buf: io.BytesIO):
+    document = docx.Document(buf)
+    extents = [
+        (inline.extent.cx, inline.extent.cy)
+        for inline in document.inline_shapes._inline_lst
+    ]
+    images = [
+        DocxImage.from_blob(part.blob) for part in document.part.package.image_parts
+    ]
+    return extents, images
+
+
+def to_docx(html: str, **kwargs):
+    image_cache.clear()
+    return html2docx(html, title="resample", **kwargs)
+
+
+def test_resample_to_max_dpi():
+    html = img_tag(photo(1500, 1000))
+    original = to_docx(html)
+    resampler = ImageResampler(max_dpi=100)
+    resampled = to_docx(html, resampler=resampler)
+    assert len(resampled.getvalue()) < len(original.getvalue())
+    original_extents, _ = pictures(original)
+    extents, [image] = pictures(resampled)
+    assert extents == original_extents
+    # The image is displayed 5.8 inches wide.
+    assert (image.px_width, image.px_height) == (580, 387)
+    assert image.content_type == "image/png"
+
+
+def test_resample_jpeg():
+    html = img_tag(photo(1000, 500, "jpeg"), "image/jpeg", ' width="200"')
+    _, [image] = pictures(to_docx(html, resampler=ImageResampler()))
+    # 200 px are displayed at 72 DPI, 2.78 inches.
+    assert (image.px_width, image.px_height) == (417, 208)
+    assert image.content_type == "image/jpeg"
+
+
+def test_photos_as_jpeg():
+    html = img_tag(photo(200, 100))
+    _, [image] = pictures(to_docx(html, resampler=ImageResampler()))
+    assert image.content_type == "image/png"
+    resampler = ImageResampler(photos_as_jpeg=True)
+    _, [image] = pictures(to_docx(html, resampler=resampler))
+    assert (image.px_width, image.px_height) == (200, 100)
+    assert image.content_type == "image/jpeg"
+
+
+def test_keep_smaller_images():
+    # Neither resampled nor a photo.
+    html = img_tag(generate_image(100, 100).getvalue())
+    resampler = ImageResampler(photos_as_jpeg=True)
+    resampled = to_docx(html, resampler=resampler)
+    assert resampled.getvalue() == to_docx(html).getvalue()
+
+
+def test_image_bytes_saved():
+    data = photo(1500, 1000)
+    html = img_tag(data) + img_tag(data) + img_tag(generate_image(1, 1).getvalue())
+    image_cache.clear()
+    parser = convert(html, "resample", resampler=ImageResampler())
+    resampled, _ = parser.doc.part.package.image_parts
+    assert parser.image_bytes_saved == len(data) - len(resampled.blob)
@@ -0,0 +1,39 @@
+import io
+
+import docx
+
+from html2docx import html2docx
+from html2docx.template import DocumentTemplate, default_template
+
+
+def test_new_document_is_a_copy():
+    template = DocumentTemplate()
+    doc = template.new_document()
+    doc.add_paragraph("copy")
+    assert len(template.document.paragraphs) == 0
+    assert len(template.new_document().paragraphs) == 0
+
+
+def test_default_template_is_cached():
+    assert default_template() is default_template()
+
+
+def test_custom_template(tmp_path):
+    template_doc = docx.Document()
+    template_doc.add_paragraph("Letterhead")
+    template_path = tmp_path / "template.docx"
+    template_doc.save(template_path)
+    template = DocumentTemplate(template_path)
+
+    for text in ["first", "second"]:
+        buf = html2docx(f"<p>{text}</p>", title=text, template=template)
+        doc = docx.Document(buf)
+        assert doc.core_properties.title == text
+        assert [p.text for p in doc.paragraphs] == ["Letterhead", text]
+
+
+def test_template_from_stream():
+    buf = io.BytesIO()
+    docx.Document().save(buf)
+    template = DocumentTemplate(buf)
+    assert template.new_document().paragraphs == []